@@ -0,0 +1,375 @@
+"""Benchmarks behind the performance numbers quoted in the history.
+
+Not collected by ``manage.py test``; run them explicitly, e.g.::
+
+    python manage.py test api.benchmarks
+    python manage.py test api.benchmarks.ListSerializationBenchmark
+
+Each benchmark seeds the test database, checks that the fast path gives
+the same result as the one it replaced and prints a table of timings.
+"""
+import heapq
+import json
+import re
+import tracemalloc
+from collections import defaultdict
+from itertools import cycle, islice
+from time import perf_counter
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Prefetch
+from django.test import TestCase
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from recipes.constants import UNIT_CONVERSIONS
+from recipes.models import (Ingredient, Recipe, RecipeIngredientAmount,
+                            ShoppingCartTotal, Tag, User)
+from .constants import (FUZZY_SEARCH_LIMIT, FUZZY_SIMILARITY_THRESHOLD,
+                        PDF_BOTTOM_MARGIN, PDF_LINE_HEIGHT, PDF_TOP)
+from .indexes import IngredientTrigramIndex, get_trigrams, normalize
+from .renderers import register_font, render_pdf
+from .serializers import RecipeListSerializer
+from .shopping_list import get_shopping_list
+from .viewer import get_viewer_flags
+
+REPEAT = 5
+INGREDIENTS_PATH = settings.BASE_DIR.parent / 'data' / 'ingredients.json'
+
+
+def measure(function, repeat=REPEAT):
+    """Best wall time of ``repeat`` calls, in milliseconds."""
+    best = None
+
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        elapsed = (perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def measure_memory(function):
+    """Peak memory traced during one call, in megabytes."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def report(title, header, rows):
+    widths = [
+        max(len(str(cell)) for cell in column)
+        for column in zip(header, *rows)
+    ]
+    print(f'\n{title}')
+    for row in (header, *rows):
+        print('  '.join(
+            str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+
+class ListSerializationBenchmark(TestCase):
+    """Recipe list items: direct dicts against the DRF field tree."""
+
+    SIZES = (6, 50, 500)
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', color=f'#00000{index}',
+                               slug=f'tag{index}')
+            for index in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(4)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {index}', text='Описание',
+                   cooking_time=10)
+            for index in range(max(cls.SIZES))
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags
+        )
+        RecipeIngredientAmount.objects.bulk_create(
+            RecipeIngredientAmount(recipe=recipe, ingredient=ingredient,
+                                   amount=100)
+            for index, recipe in enumerate(recipes)
+            for ingredient in ingredients[:3 + index % 2]
+        )
+
+    def get_page(self, size):
+        return list(Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredient_amounts',
+                queryset=RecipeIngredientAmount.objects.select_related(
+                    'ingredient')
+            )
+        ).order_by('id')[:size])
+
+    def test_list_serialization(self):
+        request = SimpleNamespace(user=AnonymousUser())
+        serializer = RecipeListSerializer(context={'request': request})
+        rows = []
+
+        def field_tree(recipes):
+            return [
+                serializers.ModelSerializer.to_representation(
+                    serializer, recipe)
+                for recipe in recipes
+            ]
+
+        def direct(recipes):
+            return [
+                RecipeListSerializer.add_viewer_fields(
+                    RecipeListSerializer.get_fragment(recipe), False,
+                    get_viewer_flags(request, recipe.id))
+                for recipe in recipes
+            ]
+
+        for size in self.SIZES:
+            recipes = self.get_page(size)
+            for recipe in recipes:
+                # Viewer flags the field tree reads as attributes.
+                recipe.is_favorited = recipe.is_in_shopping_cart = False
+                recipe.author.is_subscribed = False
+
+            expected = [
+                {key: value for key, value in item.items()
+                 if key not in RecipeListSerializer.VIEWER_FIELDS}
+                for item in field_tree(recipes)
+            ]
+            self.assertEqual(direct(recipes), expected)
+
+            rows.append((
+                size,
+                f'{measure(lambda: field_tree(recipes)):.2f}',
+                f'{measure(lambda: direct(recipes)):.2f}',
+            ))
+
+        report('Recipe list serialization, ms per page',
+               ('page', 'field tree', 'direct'), rows)
+
+
+class TrigramSearchBenchmark(TestCase):
+    """Fuzzy ingredient lookups: trigram postings against a full scan."""
+
+    QUERIES = ('сахр', 'кортофельный', 'смитана жирная 20%')
+    SYNTHETIC_SIZE = 100000
+
+    def build_index(self, size=None):
+        with open(INGREDIENTS_PATH) as file:
+            ingredients = json.load(file)
+        if size is not None:
+            ingredients = [
+                {'name': f'{ingredient["name"]} {index}',
+                 'measurement_unit': ingredient['measurement_unit']}
+                for index, ingredient in enumerate(
+                    islice(cycle(ingredients), size))
+            ]
+
+        Ingredient.objects.all().delete()
+        Ingredient.objects.bulk_create(
+            Ingredient(**ingredient) for ingredient in ingredients)
+        index = IngredientTrigramIndex()
+        index.build()
+        return index
+
+    @staticmethod
+    def scan(index, query):
+        """Score every ingredient, as a query without postings would."""
+        query_trigrams = get_trigrams(normalize(query))
+        scored = []
+
+        for position, ingredient in enumerate(index.ingredients):
+            trigrams = get_trigrams(ingredient['name'])
+            shared = len(query_trigrams & trigrams)
+            similarity = shared / (
+                len(query_trigrams) + len(trigrams) - shared)
+            if similarity >= FUZZY_SIMILARITY_THRESHOLD:
+                scored.append((-similarity, position))
+
+        return [
+            index.ingredients[position]
+            for _, position in heapq.nsmallest(FUZZY_SEARCH_LIMIT, scored)
+        ]
+
+    def test_trigram_search(self):
+        rows = []
+
+        for size in (None, self.SYNTHETIC_SIZE):
+            index = self.build_index(size)
+            for query in self.QUERIES:
+                self.assertEqual(index.search(query),
+                                 self.scan(index, query))
+                rows.append((
+                    len(index.ingredients), query,
+                    f'{measure(lambda: self.scan(index, query), 1):.2f}',
+                    f'{measure(lambda: index.search(query)):.2f}',
+                ))
+
+        report('Fuzzy ingredient search, ms per query',
+               ('rows', 'query', 'scan', 'postings'), rows)
+
+
+class ShoppingListPDFBenchmark(TestCase):
+    """PDF rendering with the font parsed per call and once per process."""
+
+    SIZES = (10, 1000, 10000)
+    PAGE_PATTERN = re.compile(rb'/Type /Page\b(?!s)')
+
+    @staticmethod
+    def render(lines, cold):
+        if cold:
+            # Every download used to parse the font again.
+            register_font.cache_clear()
+        return render_pdf('Список покупок:', lines).read()
+
+    def test_render_pdf(self):
+        rows = []
+
+        for size in self.SIZES:
+            lines = [f'Ингредиент {index}: {index} г' for index in range(size)]
+            pages = len(self.PAGE_PATTERN.findall(self.render(lines, False)))
+            lines_per_page = (
+                (PDF_TOP - PDF_BOTTOM_MARGIN) // PDF_LINE_HEIGHT + 1)
+            self.assertGreaterEqual(pages, size // lines_per_page)
+
+            row = [size, pages]
+            for cold in (True, False):
+                row += [
+                    f'{measure(lambda: self.render(lines, cold), 3):.0f}',
+                    f'{measure_memory(lambda: self.render(lines, cold)):.1f}',
+                ]
+            rows.append(row)
+
+        report('Shopping list PDF, ms and peak MB per document',
+               ('lines', 'pages', 'cold ms', 'cold MB', 'warm ms', 'warm MB'),
+               rows)
+
+
+class ShoppingListDownloadBenchmark(TestCase):
+    """Shopping list downloads in every format, through the test client."""
+
+    SIZES = (1000, 10000, 50000)
+    PDF_MAX_SIZE = 10000
+    FORMATS = ('pdf', 'csv', 'txt', 'json')
+
+    @classmethod
+    def setUpTestData(cls):
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index:05}', measurement_unit='г')
+            for index in range(max(cls.SIZES))
+        )
+        cls.users = {}
+        for size in cls.SIZES:
+            cls.users[size] = User.objects.create_user(
+                username=f'user{size}', email=f'user{size}@example.com',
+                password='password')
+            ShoppingCartTotal.objects.bulk_create(
+                ShoppingCartTotal(user=cls.users[size], ingredient=ingredient,
+                                  amount=100)
+                for ingredient in ingredients[:size]
+            )
+
+    def download(self, user, file_format):
+        """Consume the response chunk by chunk; return its line count."""
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/recipes/download_shopping_cart/',
+                              {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+
+        return sum(chunk.count(b'\n') for chunk in response.streaming_content)
+
+    def test_download(self):
+        rows = []
+
+        for size in self.SIZES:
+            row = [size]
+            for file_format in self.FORMATS:
+                if file_format == 'pdf' and size > self.PDF_MAX_SIZE:
+                    row.append('-')
+                    continue
+
+                user = self.users[size]
+                if file_format in ('csv', 'txt'):
+                    # A header line, then one line per ingredient.
+                    self.assertEqual(self.download(user, file_format),
+                                     size + 1)
+
+                elapsed = measure(lambda: self.download(user, file_format), 1)
+                peak = measure_memory(lambda: self.download(user, file_format))
+                row.append(f'{size / elapsed:.0f}k {peak:.1f} MB')
+            rows.append(row)
+
+        report('Shopping list download, rows per second and peak memory',
+               ('rows', *self.FORMATS), rows)
+
+
+class UnitConversionBenchmark(TestCase):
+    """Unit conversion in the grouped query against a Python dict."""
+
+    SIZES = (1000, 5000, 20000)
+    UNITS = ('г', 'кг', 'мл', 'л', 'ч. л.', 'ст. л.', 'шт.')
+    UNITS_PER_NAME = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {}
+        for size in cls.SIZES:
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(
+                    name=f'Ингредиент {size} {index // cls.UNITS_PER_NAME}',
+                    measurement_unit=cls.UNITS[index % len(cls.UNITS)])
+                for index in range(size)
+            )
+            cls.users[size] = User.objects.create_user(
+                username=f'user{size}', email=f'user{size}@example.com',
+                password='password')
+            ShoppingCartTotal.objects.bulk_create(
+                ShoppingCartTotal(user=cls.users[size], ingredient=ingredient,
+                                  amount=index % 50 + 1)
+                for index, ingredient in enumerate(ingredients)
+            )
+
+    @staticmethod
+    def convert_in_python(user):
+        totals = defaultdict(int)
+
+        for name, unit, amount in ShoppingCartTotal.objects.filter(
+            user=user
+        ).values_list('ingredient__name', 'ingredient__measurement_unit',
+                      'amount'):
+            unit, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+            totals[name, unit] += amount * factor
+
+        return [(*key, amount) for key, amount in sorted(totals.items())]
+
+    def test_unit_conversion(self):
+        rows = []
+
+        for size in self.SIZES:
+            user = self.users[size]
+            # Compared sorted: the database orders by its own collation.
+            self.assertEqual(sorted(get_shopping_list(user)),
+                             self.convert_in_python(user))
+            rows.append((
+                size,
+                f'{measure(lambda: self.convert_in_python(user)):.1f}',
+                f'{measure(lambda: list(get_shopping_list(user))):.1f}',
+            ))
+
+        report('Shopping list unit conversion, ms per list',
+               ('items', 'python dict', 'database'), rows)
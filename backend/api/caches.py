@@ -0,0 +1,152 @@
+import hashlib
+import json
+import time
+from array import array
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import (COUNT_TIMEOUT, EXPORT_PENDING_TIMEOUT,
+                        RECIPE_FRAGMENT_TIMEOUT, RECIPE_IDS_TIMEOUT)
+
+VERSION_KEY = 'version:{name}'
+RECIPE_FRAGMENT_KEY = 'recipe_fragment:{generation}:{recipe_id}:{version}'
+COUNT_KEY = 'count:{digest}'
+RECIPE_IDS_KEY = 'recipe_ids:{name}:{version}'
+EXPORT_PENDING_KEY = 'export_pending:{export_id}'
+
+
+def get_versions(names):
+    """Return the versions of named data sets.
+
+    Versions are timestamps of the last change in nanoseconds, so they
+    work both as cache key parts and as modification dates.
+    """
+    keys = [VERSION_KEY.format(name=name) for name in names]
+    versions = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # add() keeps a version another process has set meanwhile.
+        version = time.time_ns()
+        for key in missing:
+            cache.add(key, version, None)
+        versions.update(cache.get_many(missing))
+
+    return [versions[key] for key in keys]
+
+
+def get_version(name):
+    return get_versions([name])[0]
+
+
+def set_versions(names):
+    version = time.time_ns()
+    cache.set_many(
+        {VERSION_KEY.format(name=name): version for name in names}, None)
+
+
+def bump_version(*names):
+    """Bump versions once the current transaction, if any, commits.
+
+    Bumping earlier would let a concurrent reader cache the data it still
+    sees from before the commit under the new version.
+    """
+    transaction.on_commit(partial(set_versions, names))
+
+
+def get_recipe_fragment_keys(recipe_ids):
+    """Return the current fragment keys of recipes by id.
+
+    Keys carry the ``recipe:<id>`` version. Read them once, before the
+    recipes are loaded, and write with the same keys: a fragment rendered
+    from rows that a later commit changed then lands under a key nobody
+    reads any more.
+    """
+    recipe_ids = list(recipe_ids)
+    generation, *versions = get_versions([
+        'recipe_fragments',
+        *(f'recipe:{recipe_id}' for recipe_id in recipe_ids)
+    ])
+
+    return {
+        recipe_id: RECIPE_FRAGMENT_KEY.format(
+            generation=generation, recipe_id=recipe_id, version=version)
+        for recipe_id, version in zip(recipe_ids, versions)
+    }
+
+
+def get_recipe_fragments(keys):
+    cached = cache.get_many(keys.values())
+
+    return {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items() if key in cached
+    }
+
+
+def set_recipe_fragments(keys, fragments):
+    cache.set_many(
+        {keys[recipe_id]: fragment
+         for recipe_id, fragment in fragments.items()},
+        RECIPE_FRAGMENT_TIMEOUT
+    )
+
+
+def invalidate_recipes(recipe_ids):
+    """Expire cached recipes once the current transaction, if any, commits."""
+    bump_version(
+        'recipe_list', *(f'recipe:{recipe_id}' for recipe_id in recipe_ids))
+
+
+def invalidate_all_recipes():
+    bump_version('recipe_fragments')
+
+
+def make_count_key(version_names, *parts):
+    """Build a count cache key from filter values and data versions."""
+    versions = get_versions(version_names)
+    digest = hashlib.md5(
+        json.dumps([versions, parts], default=str).encode()).hexdigest()
+
+    return COUNT_KEY.format(digest=digest)
+
+
+def get_cached_count(key):
+    return cache.get(key)
+
+
+def set_cached_count(key, count, is_exact):
+    cache.set(key, (count, is_exact), COUNT_TIMEOUT)
+
+
+def get_recipe_ids(name, recipe_ids):
+    """Return a user's recipe id set as a sorted array, cached by version.
+
+    ``name`` is the version name of the set, e.g. ``favorites:<user id>``;
+    ``recipe_ids`` is evaluated only on a cache miss and must be sorted.
+    """
+    key = RECIPE_IDS_KEY.format(name=name, version=get_version(name))
+    cached_ids = cache.get(key)
+
+    if cached_ids is None:
+        cached_ids = array('Q', recipe_ids)
+        cache.set(key, cached_ids, RECIPE_IDS_TIMEOUT)
+
+    return cached_ids
+
+
+def mark_export_pending(export_id):
+    """Claim an export; return False if it is already being rendered."""
+    return cache.add(
+        EXPORT_PENDING_KEY.format(export_id=export_id), True,
+        EXPORT_PENDING_TIMEOUT)
+
+
+def is_export_pending(export_id):
+    return cache.get(EXPORT_PENDING_KEY.format(export_id=export_id), False)
+
+
+def clear_export_pending(export_id):
+    cache.delete(EXPORT_PENDING_KEY.format(export_id=export_id))
@@ -1,2 +1,26 @@
 PAGE_SIZE = 6
 MIN_PAGE_SIZE = 1
+CURSOR_PAGINATION = 'cursor'
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+COUNT_TIMEOUT = 60 * 10
+RECIPE_IDS_TIMEOUT = 60 * 60 * 24
+COUNT_ESTIMATE_THRESHOLD = 100_000
+FUZZY_SEARCH_LIMIT = 20
+FUZZY_SIMILARITY_THRESHOLD = 0.3
+FUZZY_QUERY_MIN_LENGTH = 3
+FUZZY_QUERY_MAX_LENGTH = 64
+SHOPPING_LIST_FILENAME = 'shopping_cart.{format}'
+PDF_FONT_NAME = 'DejaVuSerif'
+PDF_FONT_SIZE = 12
+PDF_LEFT_MARGIN = 100
+PDF_TOP = 800
+PDF_BOTTOM_MARGIN = 40
+PDF_LINE_HEIGHT = 20
+PDF_SPOOL_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_TITLE = 'Список покупок:'
+EXPORT_WORKERS = 2
+EXPORT_DIR = 'exports'
+EXPORT_STORAGE_MAX_SIZE = 256 * 1024 * 1024
+EXPORT_PENDING_TIMEOUT = 60 * 10
+EXPORT_RETRY_AFTER = 1
+BULK_MAX_SIZE = 100
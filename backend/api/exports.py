@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from django.conf import settings
+
+from .caches import clear_export_pending, mark_export_pending
+from .constants import EXPORT_DIR, EXPORT_STORAGE_MAX_SIZE, EXPORT_WORKERS
+from .renderers import render_pdf
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+
+
+def get_export_dir():
+    return Path(settings.MEDIA_ROOT) / EXPORT_DIR
+
+
+def get_export_path(export_id):
+    return get_export_dir() / f'{export_id}.pdf'
+
+
+def get_export_id(title, lines):
+    """Name an export after its contents, so equal carts share a file."""
+    return hashlib.sha256(
+        json.dumps([title, lines], ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def touch(path):
+    """Mark an export as recently used; return False if it is missing."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def start_export(title, lines):
+    """Return the export id, queueing the render unless it exists."""
+    export_id = get_export_id(title, lines)
+
+    if not touch(get_export_path(export_id)) and mark_export_pending(
+            export_id):
+        executor.submit(run_export, export_id, title, lines)
+
+    return export_id
+
+
+def get_export(export_id):
+    """Return the export path if it is ready, otherwise None."""
+    path = get_export_path(export_id)
+    return path if touch(path) else None
+
+
+def run_export(export_id, title, lines):
+    path = get_export_path(export_id)
+    temp_path = None
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with render_pdf(title, lines) as document, NamedTemporaryFile(
+                dir=path.parent, suffix='.tmp', delete=False) as temp:
+            temp_path = temp.name
+            shutil.copyfileobj(document, temp)
+        os.replace(temp_path, path)
+        evict_exports(keep=path)
+    except Exception:
+        logger.exception('Export %s failed', export_id)
+        if temp_path is not None:
+            Path(temp_path).unlink(missing_ok=True)
+    finally:
+        clear_export_pending(export_id)
+
+
+def evict_exports(keep=None):
+    """Delete least recently used exports beyond the storage budget."""
+    exports = []
+    for path in get_export_dir().glob('*.pdf'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        exports.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in exports)
+    for _, size, path in sorted(exports):
+        if total_size <= EXPORT_STORAGE_MAX_SIZE:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        total_size -= size
@@ -3,6 +3,7 @@ from django_filters import ModelMultipleChoiceFilter
 from django_filters.rest_framework import CharFilter, FilterSet
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import get_recipe_search
 from .serializers import User
 
 
@@ -32,23 +33,43 @@ class RecipeFilter(FilterSet):
         field_name='author',
         method='filter_by_author'
     )
+    search = CharFilter(
+        field_name='search',
+        method='filter_search'
+    )
 
     class Meta:
         model = Recipe
         fields = ['is_favorited', 'tags', 'is_in_shopping_cart']
 
+    def filter_by_user_recipes(self, queryset, related_name, value):
+        user = self.request.user
+
+        if value != '1':
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none()
+
+        # Ordering by the joined recipe_id, equal to the recipe id, lets
+        # the planner walk the user's rows through the (user, recipe)
+        # unique index instead of scanning every recipe.
+        return queryset.filter(
+            **{f'{related_name}__user': user}
+        ).order_by(f'-{related_name}__recipe_id')
+
     def filter_is_favorited(self, queryset, name, value):
-        if value == '1':
-            return queryset.filter(is_favorited=True)
-        return queryset
+        return self.filter_by_user_recipes(
+            queryset, 'favorite_recipes', value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if value == '1':
-            return queryset.filter(is_in_shopping_cart=True)
-        return queryset
+        return self.filter_by_user_recipes(
+            queryset, 'shopping_cart_recipes', value)
 
     def filter_by_author(self, queryset, name, value):
         author = get_object_or_404(User, id=value)
         author_recipe_ids = author.recipes.values_list(
             'id', flat=True)
         return queryset.filter(id__in=author_recipe_ids)
+
+    def filter_search(self, queryset, name, value):
+        return get_recipe_search().search(queryset, value)
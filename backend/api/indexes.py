@@ -0,0 +1,154 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from math import ceil
+
+from recipes.models import Ingredient
+from .caches import get_version
+from .constants import (FUZZY_QUERY_MAX_LENGTH, FUZZY_QUERY_MIN_LENGTH,
+                        FUZZY_SEARCH_LIMIT, FUZZY_SIMILARITY_THRESHOLD)
+
+MAX_CHAR = '\U0010ffff'
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+def get_trigrams(value):
+    """Split a value into trigrams the way pg_trgm does."""
+    trigrams = set()
+
+    for word in ''.join(
+        char if char.isalnum() else ' ' for char in normalize(value)
+    ).split():
+        padded = f'  {word} '
+        trigrams.update(
+            padded[index:index + 3] for index in range(len(padded) - 2))
+
+    return trigrams
+
+
+class IngredientIndex:
+    """Base class for in-memory indexes over the ingredient catalog.
+
+    The catalog is kept in id order. Indexes are rebuilt lazily once the
+    ``ingredients`` version, bumped by the ingredient signals, changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.ingredients = []
+
+    def build(self, version=None):
+        if version is None:
+            version = get_version('ingredients')
+
+        ingredients = list(
+            Ingredient.objects.order_by('id').values(
+                'id', 'name', 'measurement_unit')
+        )
+
+        with self.lock:
+            self.ingredients = ingredients
+            self.index(ingredients)
+            self.version = version
+
+    def refresh(self):
+        version = get_version('ingredients')
+
+        if version != self.version:
+            self.build(version)
+
+    def index(self, ingredients):
+        raise NotImplementedError
+
+
+class IngredientPrefixIndex(IngredientIndex):
+    """Prefix lookups over normalized ingredient names.
+
+    Keeps the normalized names sorted next to an array of positions in
+    the catalog, so a lookup is two binary searches.
+    """
+
+    def index(self, ingredients):
+        entries = sorted(
+            (normalize(ingredient['name']), position)
+            for position, ingredient in enumerate(ingredients)
+        )
+        self.keys = [key for key, _ in entries]
+        self.positions = array('I', (position for _, position in entries))
+
+    def search(self, prefix):
+        self.refresh()
+        key = normalize(prefix)
+
+        with self.lock:
+            start = bisect_left(self.keys, key)
+            end = bisect_left(self.keys, key + MAX_CHAR, start)
+            positions = sorted(self.positions[start:end])
+
+            return [self.ingredients[position] for position in positions]
+
+
+class IngredientTrigramIndex(IngredientIndex):
+    """Typo-tolerant lookups ranked by trigram similarity.
+
+    Similarity is the pg_trgm one: shared trigrams divided by the
+    trigrams of both strings. Shared counts come from counting the
+    postings of the query trigrams, and queries are cut to
+    ``FUZZY_QUERY_MAX_LENGTH`` characters, which bounds the work per
+    lookup.
+    """
+
+    def index(self, ingredients):
+        postings = defaultdict(lambda: array('I'))
+        self.sizes = array('H')
+
+        for position, ingredient in enumerate(ingredients):
+            trigrams = get_trigrams(ingredient['name'])
+            self.sizes.append(len(trigrams))
+
+            for trigram in trigrams:
+                postings[trigram].append(position)
+
+        self.postings = dict(postings)
+
+    def search(self, query, limit=FUZZY_SEARCH_LIMIT,
+               threshold=FUZZY_SIMILARITY_THRESHOLD):
+        query = normalize(query)[:FUZZY_QUERY_MAX_LENGTH]
+
+        if len(query) < FUZZY_QUERY_MIN_LENGTH:
+            return []
+
+        self.refresh()
+        query_trigrams = get_trigrams(query)
+        required = max(1, ceil(threshold * len(query_trigrams)))
+
+        with self.lock:
+            counts = Counter()
+            for trigram in query_trigrams:
+                counts.update(self.postings.get(trigram, ()))
+
+            scored = []
+            for position, shared in counts.items():
+                if shared < required:
+                    continue
+
+                similarity = shared / (
+                    len(query_trigrams) + self.sizes[position] - shared)
+
+                if similarity >= threshold:
+                    scored.append((-similarity, position))
+
+            return [
+                self.ingredients[position]
+                for _, position in heapq.nsmallest(limit, scored)
+            ]
+
+
+ingredient_index = IngredientPrefixIndex()
+ingredient_trigram_index = IngredientTrigramIndex()
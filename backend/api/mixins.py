@@ -0,0 +1,132 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from recipes.relations import add_relations, remove_relations
+from .caches import get_versions
+from .serializers import BulkIdsSerializer
+
+
+class ConditionalResponse(Exception):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """Weak ETag and Last-Modified headers for read actions.
+
+    Validators are built from data versions instead of the response
+    body, so a matching ``If-None-Match`` or ``If-Modified-Since``
+    returns 304 before the queryset or serializer is touched. Views
+    define ``get_condition_key()`` returning the version names and any
+    extra values the response depends on.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    condition = None
+
+    def get_condition_key(self):
+        raise NotImplementedError
+
+    def get_condition(self):
+        version_names, parts = self.get_condition_key()
+        versions = get_versions(version_names)
+        digest = hashlib.md5(
+            json.dumps([versions, parts], default=str).encode()).hexdigest()
+
+        return f'W/{quote_etag(digest)}', max(versions) // 10 ** 9
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        is_read = request.method in ('GET', 'HEAD')
+
+        if is_read and self.action in self.conditional_actions:
+            self.condition = self.get_condition()
+            etag, last_modified = self.condition
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+
+            if response is not None:
+                raise ConditionalResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+
+        if self.condition is not None and response.status_code in (200, 304):
+            etag, last_modified = self.condition
+            response.headers['ETag'] = etag
+            response.headers['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+
+        return response
+
+
+class BulkRelationMixin:
+    """Batch add and remove of the viewer's links to many objects.
+
+    ``relation_model`` links the viewer through ``owner_field`` to the
+    objects of ``get_queryset()`` through ``relation_field``. A batch is
+    validated with one ``IN`` query and applied with one statement.
+    """
+
+    relation_model = None
+    relation_field = None
+    owner_field = 'user_id'
+
+    def get_bulk_ids(self):
+        serializer = BulkIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    def get_valid_ids(self, ids):
+        return set(self.get_queryset().filter(
+            pk__in=ids).values_list('pk', flat=True))
+
+    def bulk_add(self, request):
+        ids = self.get_bulk_ids()
+        valid_ids = self.get_valid_ids(ids)
+        added = add_relations(
+            self.relation_model, self.relation_field,
+            [pk for pk in ids if pk in valid_ids],
+            **{self.owner_field: request.user.id})
+
+        return self.get_bulk_response(ids, valid_ids, added, 'added', 'exists')
+
+    def bulk_remove(self, request):
+        ids = self.get_bulk_ids()
+        valid_ids = self.get_valid_ids(ids)
+        removed = remove_relations(
+            self.relation_model, self.relation_field,
+            [pk for pk in ids if pk in valid_ids],
+            **{self.owner_field: request.user.id})
+
+        return self.get_bulk_response(
+            ids, valid_ids, removed, 'removed', 'missing')
+
+    def get_bulk_response(self, ids, valid_ids, changed_ids, changed_status,
+                          unchanged_status):
+        results = []
+
+        for pk in ids:
+            if pk in changed_ids:
+                item_status = changed_status
+            elif pk in valid_ids:
+                item_status = unchanged_status
+            else:
+                item_status = 'not_found'
+            results.append({'id': pk, 'status': item_status})
+
+        return Response({'results': results})
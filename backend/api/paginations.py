@@ -1,12 +1,125 @@
-from rest_framework.pagination import PageNumberPagination
+from functools import cached_property, partial
 
-from .constants import MIN_PAGE_SIZE, PAGE_SIZE
+from django.core.paginator import Paginator
+from django.db import connection
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
+from .caches import get_cached_count, set_cached_count
+from .constants import (COUNT_ESTIMATE_THRESHOLD, CURSOR_PAGINATION,
+                        MIN_PAGE_SIZE, PAGE_SIZE)
 
-class CustomPagination(PageNumberPagination):
+
+class CountStrategy:
+    """Count a paginated queryset as cheaply as its size allows.
+
+    Counts are cached under ``key`` when the view provides one. On
+    PostgreSQL the planner estimate is used instead of ``COUNT(*)`` once
+    it exceeds ``estimate_threshold``.
+    """
+
+    def __init__(self, key=None,
+                 estimate_threshold=COUNT_ESTIMATE_THRESHOLD):
+        self.key = key
+        self.estimate_threshold = estimate_threshold
+
+    def count(self, queryset):
+        if self.key is not None:
+            cached = get_cached_count(self.key)
+            if cached is not None:
+                return cached
+
+        estimate = self.estimate(queryset)
+
+        if estimate is not None and estimate > self.estimate_threshold:
+            result = (estimate, False)
+        else:
+            result = (queryset.count(), True)
+
+        if self.key is not None:
+            set_cached_count(self.key, *result)
+
+        return result
+
+    @staticmethod
+    def estimate(queryset):
+        if connection.vendor != 'postgresql':
+            return None
+
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+
+        return plan[0]['Plan']['Plan Rows']
+
+
+class CountStrategyPaginator(Paginator):
+    def __init__(self, object_list, per_page, count_strategy, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+        self.count_is_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_is_exact = self.count_strategy.count(
+            self.object_list)
+        return count
+
+
+class LimitPageSizeMixin:
     page_size = PAGE_SIZE
 
     def get_page_size(self, request):
         page_size = int(request.query_params.get('limit', self.page_size))
 
         return max(page_size, MIN_PAGE_SIZE)
+
+
+class CustomCursorPagination(LimitPageSizeMixin, CursorPagination):
+    ordering = '-id'
+
+
+class CustomPagination(LimitPageSizeMixin, PageNumberPagination):
+    """Page number pagination with an opt-in keyset mode.
+
+    ``?pagination=cursor`` switches to ``CustomCursorPagination``: pages
+    are selected by ``id`` without ``COUNT(*)`` or ``OFFSET``, so a deep
+    page costs the same as the first one.
+
+    In page number mode the total goes through ``CountStrategy``; views
+    opt into count caching by defining ``get_count_key()``.
+    """
+    pagination_mode_query_param = 'pagination'
+    cursor_pagination_class = CustomCursorPagination
+
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.pagination_mode_query_param)
+
+        if mode == CURSOR_PAGINATION:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+
+        get_count_key = getattr(view, 'get_count_key', None)
+        self.django_paginator_class = partial(
+            CountStrategyPaginator,
+            count_strategy=CountStrategy(
+                get_count_key() if get_count_key else None)
+        )
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+
+        return Response({
+            'count': self.page.paginator.count,
+            'count_is_exact': self.page.paginator.count_is_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
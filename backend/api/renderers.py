@@ -0,0 +1,119 @@
+import csv
+import json
+from functools import lru_cache
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .constants import (PDF_BOTTOM_MARGIN, PDF_FONT_NAME, PDF_FONT_SIZE,
+                        PDF_LEFT_MARGIN, PDF_LINE_HEIGHT, PDF_SPOOL_MAX_SIZE,
+                        PDF_TOP)
+
+FONT_PATH = Path(__file__).resolve().parent / 'DejaVuSerif.ttf'
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Parse the TTF once per process; reportlab subsets it on embed."""
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, FONT_PATH))
+    return PDF_FONT_NAME
+
+
+def render_pdf(title, lines):
+    """Render lines to a paginated PDF and return it as a rewound file.
+
+    The document is written to a spooled temporary file, which moves to
+    disk once it outgrows ``PDF_SPOOL_MAX_SIZE``.
+    """
+    font_name = register_font()
+    file = SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(file, pagesize=A4, pageCompression=1)
+    pdf.setFont(font_name, PDF_FONT_SIZE)
+    pdf.drawString(PDF_LEFT_MARGIN, PDF_TOP, title)
+    y_position = PDF_TOP - PDF_LINE_HEIGHT
+
+    for line in lines:
+        if y_position < PDF_BOTTOM_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font_name, PDF_FONT_SIZE)
+            y_position = PDF_TOP
+        pdf.drawString(PDF_LEFT_MARGIN, y_position, line)
+        y_position -= PDF_LINE_HEIGHT
+
+    pdf.save()
+    file.seek(0)
+    return file
+
+
+def format_shopping_list_line(name, measurement_unit, amount):
+    return f'{name}: {amount} {measurement_unit}'
+
+
+class Echo:
+    """File-like object that hands written data back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListPDFRenderer(BaseRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    """Plain text shopping list, one ``name: amount unit`` per line."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(
+            f'{key}: {value}\n' for key, value in data.items()).encode()
+
+    def stream(self, title, rows):
+        yield f'{title}\n'
+        for row in rows:
+            yield format_shopping_list_line(*row) + '\n'
+
+
+class ShoppingListCSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'measurement_unit', 'amount')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.stream_rows(data.items())).encode()
+
+    def stream(self, title, rows):
+        yield from self.stream_rows([self.header])
+        yield from self.stream_rows(rows)
+
+    def stream_rows(self, rows):
+        writer = csv.writer(Echo())
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class ShoppingListJSONRenderer(JSONRenderer):
+    """JSON array of ingredient totals, streamed one item at a time."""
+
+    def stream(self, title, rows):
+        separator = '['
+        for name, measurement_unit, amount in rows:
+            yield separator + json.dumps(
+                {'name': name, 'measurement_unit': measurement_unit,
+                 'amount': amount},
+                ensure_ascii=False)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
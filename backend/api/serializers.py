@@ -3,17 +3,22 @@ import re
 import uuid
 
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
 
+from recipes.images import get_image_variants
 from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
                             RecipeIngredientAmount, ShoppingCartRecipe,
                             Subscription, Tag)
+from recipes.relations import set_recipe_ingredients
 from users.constants import USERNAME_PATTERN
-from recipes.constants import MIN_INGREDIENT_AMOUNT, MIN_COOKING_TIME_VALUE
+from recipes.constants import MIN_COOKING_TIME_VALUE
+from .constants import BULK_MAX_SIZE
+from .viewer import get_followed_author_ids, get_viewer_flags
 
 User = get_user_model()
 
@@ -46,11 +51,10 @@ class CustomUserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, instance):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated and instance.subscriptions_as_user.filter(
-                subscriber=user).exists()
-        )
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
+
+        return instance.id in get_followed_author_ids(self.context['request'])
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -95,6 +99,33 @@ class Base64ImageField(serializers.Field):
         return value.url if value else None
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Many related field that loads all objects with one query."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            if isinstance(pk, bool) or not isinstance(pk, (int, str)):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+            try:
+                pks.append(int(pk))
+            except ValueError:
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+
+        return [objects[pk] for pk in pks]
+
+
 class RecipeListSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     author = CustomUserSerializer(default=CurrentUserDefault())
@@ -103,41 +134,96 @@ class RecipeListSerializer(serializers.ModelSerializer):
         many=True, source='recipe_ingredient_amounts')
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    VIEWER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+
+    def to_representation(self, instance):
+        return self.add_viewer_fields(
+            self.get_fragment(instance),
+            self.fields['author'].get_is_subscribed(instance.author),
+            get_viewer_flags(self.context['request'], instance.id)
+        )
 
+    @staticmethod
+    def get_fragment(instance):
+        """Render the viewer-independent part of a recipe into a dict.
+
+        Read-only fast path for list pages: it produces exactly what the
+        declared fields would, without walking the nested field tree for
+        every tag, ingredient and author. Expects the author, tags and
+        ingredient amounts to be loaded eagerly.
+        """
+        author = instance.author
+        return {
+            'id': instance.id,
+            'tags': [
+                {
+                    'id': tag.id,
+                    'name': tag.name,
+                    'color': tag.color,
+                    'slug': tag.slug,
+                }
+                for tag in instance.tags.all()
+            ],
+            'author': {
+                'email': author.email,
+                'id': author.id,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+            },
+            'ingredients': [
+                {
+                    'id': amount.ingredient.id,
+                    'name': amount.ingredient.name,
+                    'measurement_unit': amount.ingredient.measurement_unit,
+                    'amount': amount.amount,
+                }
+                for amount in instance.recipe_ingredient_amounts.all()
+            ],
+            'name': instance.name,
+            'image': instance.image.url if instance.image else None,
+            'image_variants': get_image_variants(instance),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+        }
 
-class RecipeIngredientAmountCreateSerializer(serializers.ModelSerializer):
-    amount = serializers.IntegerField()
+    @classmethod
+    def add_viewer_fields(cls, fragment, is_subscribed, flags):
+        representation = {
+            'id': fragment['id'],
+            'tags': fragment['tags'],
+            'author': {**fragment['author'], 'is_subscribed': is_subscribed},
+            'ingredients': fragment['ingredients'],
+        }
 
-    class Meta:
-        model = RecipeIngredientAmount
-        fields = ('recipe', 'ingredient', 'amount')
+        for field_name in cls.VIEWER_FIELDS:
+            if field_name in flags:
+                representation[field_name] = bool(flags[field_name])
 
-    def validate_amount(self, data):
-        if data < MIN_INGREDIENT_AMOUNT:
-            raise serializers.ValidationError(
-                'Количество должно быть положительным числом.')
-        return data
+        for field_name in ('name', 'image', 'image_variants', 'text',
+                           'cooking_time'):
+            representation[field_name] = fragment[field_name]
 
-    def create(self, validated_data):
-        ingredient = validated_data.pop('ingredient')
-        recipe_ingredient_amount = RecipeIngredientAmount.objects.create(
-            ingredient=ingredient,
-            **validated_data
-        )
-        return recipe_ingredient_amount
+        return representation
+
+    def get_image_variants(self, instance):
+        return get_image_variants(instance)
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     author = CustomUserSerializer(default=CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all())
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()))
     ingredients = RecipeIngredientAmountListSerializer(
         many=True, source='recipe_ingredient_amounts')
 
@@ -161,9 +247,6 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         if len(set(tag_ids)) != len(tag_ids):
             raise serializers.ValidationError('Теги не должны дублироваться.')
 
-        for tag_id in tag_ids:
-            get_object_or_404(Tag, id=tag_id)
-
         return data
 
     def validate_ingredients(self, data):
@@ -178,34 +261,25 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Ингредиенты не должны дублироваться.')
 
+        existing_ids = set(Ingredient.objects.filter(
+            id__in=ingredient_ids).values_list('id', flat=True))
         for ingredient_id in ingredient_ids:
-            get_object_or_404(Ingredient, id=ingredient_id)
+            if ingredient_id not in existing_ids:
+                raise serializers.ValidationError(
+                    f'Ингредиент с id {ingredient_id} не существует.')
 
         return data
 
     @staticmethod
-    def create_recipe_ingredient_amounts(ingredients, recipe):
-        recipe_ingredient_amounts = []
-
-        for ingredient_data in ingredients:
-            ingredient_id = ingredient_data['ingredient']['id']
-            amount = ingredient_data['amount']
-
-            serializer = RecipeIngredientAmountCreateSerializer(
-                data={
-                    'ingredient': ingredient_id,
-                    'amount': amount,
-                    'recipe': recipe.id
-                }
-            )
-
-            if not serializer.is_valid():
-                raise serializers.ValidationError(serializer.errors)
-
-            recipe_ingredient_amounts.append(serializer.save())
-
-        return recipe_ingredient_amounts
-
+    def set_recipe_ingredient_amounts(recipe, ingredients):
+        set_recipe_ingredients(recipe, {
+            ingredient_data['ingredient']['id']: ingredient_data['amount']
+            for ingredient_data in ingredients
+        })
+        prefetch_related_objects(
+            [recipe], 'recipe_ingredient_amounts__ingredient')
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredient_amounts')
@@ -213,31 +287,37 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
 
-        self.create_recipe_ingredient_amounts(ingredients, recipe)
+        self.set_recipe_ingredient_amounts(recipe, ingredients)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('recipe_ingredient_amounts')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('recipe_ingredient_amounts', None)
 
         super().update(instance, validated_data)
 
-        instance.tags.clear()
-        instance.tags.set(tags)
+        # set() only adds and removes the links that differ.
+        if tags is not None:
+            instance.tags.set(tags)
 
-        instance.ingredients.clear()
-        self.create_recipe_ingredient_amounts(ingredients, instance)
+        if ingredients is not None:
+            self.set_recipe_ingredient_amounts(instance, ingredients)
 
         return instance
 
 
 class RecipeMiniListSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+    def get_image_variants(self, instance):
+        return get_image_variants(instance)
 
 
 class RecipeFavoritesSerializer(serializers.ModelSerializer):
@@ -249,14 +329,6 @@ class RecipeFavoritesSerializer(serializers.ModelSerializer):
         return RecipeMiniListSerializer(
             instance.recipe, context=self.context).data
 
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-        if user.favorite_recipes.filter(recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Этот рецепт уже добавлен в избранное.')
-        return data
-
 
 class RecipeShoppingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -267,14 +339,6 @@ class RecipeShoppingSerializer(serializers.ModelSerializer):
         return RecipeMiniListSerializer(
             instance.recipe, context=self.context).data
 
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-        if user.shopping_cart_recipes.filter(recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Этот рецепт уже добавлен в карзину.')
-        return data
-
 
 class SubscriptionListSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
@@ -299,22 +363,12 @@ class SubscriptionListSerializer(CustomUserSerializer):
         return representation
 
     def get_recipes(self, instance):
-        recipes_limit = self.context.get('recipes_limit')
-        recipes = instance.recipes.all().order_by('-id')
-
-        try:
-            recipes_limit = int(
-                recipes_limit) if recipes_limit is not None else None
-        except (ValueError, TypeError):
-            recipes_limit = None
-
-        if recipes_limit is not None and recipes_limit > 0:
-            recipes = recipes[:recipes_limit]
-
-        return RecipeMiniListSerializer(recipes, many=True).data
+        """Expects ``latest_recipes`` prefetched by the view."""
+        return RecipeMiniListSerializer(
+            instance.latest_recipes, many=True).data
 
     def get_recipes_count(self, instance):
-        return instance.recipes.count()
+        return instance.recipes_count
 
 
 class SubscriptionCreateDeleteSerializer(serializers.ModelSerializer):
@@ -325,16 +379,10 @@ class SubscriptionCreateDeleteSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         return CustomUserSerializer(instance.user, context=self.context).data
 
-    def validate(self, data):
-        user = data['user']
-        subscriber = data['subscriber']
-
-        if Subscription.objects.filter(
-                user=user, subscriber=subscriber).exists():
-            raise serializers.ValidationError('Подписка уже существует')
-
-        if user == subscriber:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя')
 
-        return data
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_SIZE
+    )
@@ -0,0 +1,36 @@
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipes.constants import UNIT_CONVERSIONS
+from recipes.models import ShoppingCartTotal
+from .renderers import format_shopping_list_line
+
+CANONICAL_UNIT = Case(
+    *(When(ingredient__measurement_unit=unit, then=Value(canonical_unit))
+      for unit, (canonical_unit, _) in UNIT_CONVERSIONS.items()),
+    default=F('ingredient__measurement_unit'),
+)
+UNIT_FACTOR = Case(
+    *(When(ingredient__measurement_unit=unit, then=Value(factor))
+      for unit, (_, factor) in UNIT_CONVERSIONS.items()),
+    default=Value(1),
+    output_field=IntegerField(),
+)
+
+
+def get_shopping_list(user):
+    """Ingredient totals for the user's shopping cart.
+
+    Reads the incrementally maintained totals table, converts amounts
+    to canonical units with ``UNIT_CONVERSIONS`` and groups them by
+    ingredient name, all in the database. Yields
+    ``(name, measurement_unit, amount)`` rows ordered by name.
+    """
+    return ShoppingCartTotal.objects.filter(user=user).values_list(
+        'ingredient__name', CANONICAL_UNIT
+    ).annotate(
+        total_amount=Sum(F('amount') * UNIT_FACTOR)
+    ).order_by('ingredient__name', CANONICAL_UNIT)
+
+
+def get_shopping_list_lines(user):
+    return [format_shopping_list_line(*row) for row in get_shopping_list(user)]
@@ -0,0 +1,89 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCartRecipe,
+                            Subscription, Tag, User)
+from recipes.images import recipe_image_variants_changed
+from recipes.signals import recipe_ingredients_changed, relations_changed
+from .caches import bump_version, invalidate_all_recipes, invalidate_recipes
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, created=False, **kwargs):
+    invalidate_recipes([instance.pk])
+
+    if created or kwargs['signal'] is post_delete:
+        bump_version('recipes')
+
+
+@receiver(post_save, sender=RecipeIngredientAmount)
+@receiver(post_delete, sender=RecipeIngredientAmount)
+def invalidate_recipe_ingredient_amount(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(recipe_image_variants_changed, sender=Recipe)
+@receiver(recipe_ingredients_changed, sender=Recipe)
+def invalidate_recipe_contents(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_relations(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if sender is Recipe.tags.through:
+        bump_version('recipes')
+
+    if not reverse:
+        invalidate_recipes([instance.pk])
+    elif pk_set:
+        invalidate_recipes(pk_set)
+    else:
+        invalidate_all_recipes()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_version('tags')
+    invalidate_all_recipes()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_version('ingredients')
+    invalidate_all_recipes()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+
+    bump_version(f'user:{instance.pk}')
+    invalidate_recipes(
+        instance.recipes.values_list('id', flat=True))
+
+
+@receiver(relations_changed, sender=FavoriteRecipe)
+def invalidate_favorites(sender, instances, **kwargs):
+    bump_version(*{f'favorites:{instance.user_id}' for instance in instances})
+
+
+@receiver(relations_changed, sender=ShoppingCartRecipe)
+def invalidate_shopping_cart(sender, instances, **kwargs):
+    bump_version(
+        *{f'shopping_cart:{instance.user_id}' for instance in instances})
+
+
+@receiver(relations_changed, sender=Subscription)
+def invalidate_subscriptions(sender, instances, **kwargs):
+    bump_version(
+        *{f'subscriptions:{instance.subscriber_id}' for instance in instances})
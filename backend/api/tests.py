@@ -0,0 +1,504 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from itertools import product
+from random import Random
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCartRecipe, Tag)
+from recipes.constants import IMAGE_VARIANTS
+from recipes.counters import reconcile_counters
+from recipes.totals import compute_totals, get_stored_totals, rebuild_totals
+from users.models import User
+from .caches import (get_recipe_fragment_keys, set_recipe_fragments,
+                     set_versions)
+from .indexes import ingredient_index
+from .serializers import RecipeListSerializer
+
+
+class APITestCase(TestCase):
+    """Users, a token client and an anonymous client on a clean cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('user')
+        cls.author = cls.create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                     slug='breakfast')
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('мука', 'г'), ('молоко', 'мл'),
+                               ('яйца', 'шт.'))
+        ]
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password', first_name='Имя', last_name='Фамилия')
+
+    @classmethod
+    def create_recipe(cls, name='Блины', author=None, amounts=None):
+        recipe = Recipe.objects.create(
+            author=author or cls.author, name=name, text='Описание',
+            cooking_time=10)
+        recipe.tags.add(cls.tag)
+        RecipeIngredientAmount.objects.bulk_create(
+            RecipeIngredientAmount(recipe=recipe, ingredient=ingredient,
+                                   amount=amount)
+            for ingredient, amount in (amounts or {
+                cls.ingredients[0]: 200, cls.ingredients[1]: 300}).items()
+        )
+        return recipe
+
+    @staticmethod
+    def make_image():
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def use_temporary_media(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}')
+
+
+class ConditionalGetTests(APITestCase):
+    """A repeated GET with the returned ETag is a cheap 304."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = cls.create_recipe()
+
+    def assertNotModified(self, client, url, queries):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(queries):
+            response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_anonymous_not_modified_without_queries(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/',
+                    '/api/tags/', '/api/ingredients/',
+                    f'/api/users/{self.author.id}/'):
+            with self.subTest(url=url):
+                self.assertNotModified(self.anonymous, url, 0)
+
+    def test_authenticated_not_modified_with_one_query(self):
+        for url in ('/api/recipes/', '/api/recipes/?is_favorited=1',
+                    f'/api/recipes/{self.recipe.id}/', '/api/tags/',
+                    '/api/ingredients/', f'/api/users/{self.author.id}/',
+                    '/api/users/me/'):
+            with self.subTest(url=url):
+                self.assertNotModified(self.client, url, 1)
+
+    def test_change_invalidates_etag(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.anonymous.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Оладьи'
+            self.recipe.save()
+
+        response = self.anonymous.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Оладьи')
+
+    def test_fragment_rendered_before_change_is_not_cached(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        # A slow request reads the keys and the rows, then a change
+        # commits before it writes the rendered fragment back.
+        keys = get_recipe_fragment_keys([self.recipe.id])
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.get(pk=self.recipe.pk)
+            recipe.name = 'Оладьи'
+            recipe.save()
+
+        set_recipe_fragments(
+            keys, {stale.id: RecipeListSerializer.get_fragment(stale)})
+
+        self.assertEqual(self.anonymous.get(url).json()['name'], 'Оладьи')
+
+    def test_image_variants_made_by_command(self):
+        self.use_temporary_media()
+        self.recipe.image.save('recipe.png', ContentFile(self.make_image()))
+        response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['image_variants'], {})
+
+        # The command runs in its own process; it invalidates through the
+        # shared cache the server reads its versions from.
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('make_image_variants', stdout=StringIO(),
+                         stderr=StringIO())
+
+        response = self.anonymous.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.json()['results'][0]['image_variants']),
+            set(IMAGE_VARIANTS))
+
+
+class IngredientIndexTests(APITestCase):
+    """The in-memory index follows the shared ``ingredients`` version."""
+
+    def get_names(self, **params):
+        response = self.anonymous.get('/api/ingredients/', params)
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_search_matches_yo_as_ye(self):
+        self.assertEqual(self.get_names(name='еж'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Ёжевика', measurement_unit='г')
+
+        self.assertEqual(self.get_names(name='еж'), ['Ёжевика'])
+
+    def test_rows_written_by_another_process(self):
+        ingredient_index.build()
+        etag = self.anonymous.get('/api/ingredients/')['ETag']
+
+        # Another process inserts the rows; its signal receivers bump the
+        # version in the shared cache, which is all this process sees.
+        Ingredient.objects.bulk_create([
+            Ingredient(name='соль', measurement_unit='г'),
+            Ingredient(name='сода', measurement_unit='г'),
+        ])
+        set_versions(['ingredients'])
+
+        response = self.anonymous.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(self.get_names(name='со'), ['соль', 'сода'])
+
+
+class ShoppingCartDownloadTests(APITestCase):
+    """The shopping list is one grouped query whatever the cart size."""
+
+    FORMATS = ('txt', 'csv', 'json', 'pdf')
+
+    def fill_cart(self, size):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=self.author, name=f'Рецепт {index}',
+                   cooking_time=10)
+            for index in range(size)
+        )
+        RecipeIngredientAmount.objects.bulk_create(
+            RecipeIngredientAmount(recipe=recipe, ingredient=ingredient,
+                                   amount=amount)
+            for recipe in recipes
+            for ingredient, amount in ((self.ingredients[0], 200),
+                                       (self.ingredients[1], 300))
+        )
+        ShoppingCartRecipe.objects.bulk_create(
+            ShoppingCartRecipe(user=self.user, recipe=recipe)
+            for recipe in recipes
+        )
+        rebuild_totals([self.user.id])
+
+    def download(self, file_format):
+        # The token lookup and the grouped shopping list query.
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/',
+                {'format': file_format})
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content)
+
+    def test_constant_query_count(self):
+        filled = 0
+
+        for size in (1, 50, 500):
+            self.fill_cart(size - filled)
+            filled = size
+
+            for file_format in self.FORMATS:
+                with self.subTest(size=size, format=file_format):
+                    self.download(file_format)
+
+            self.assertEqual(self.download('txt').decode().splitlines(), [
+                'Список покупок:',
+                f'молоко: {300 * size} мл',
+                f'мука: {200 * size} г',
+            ])
+
+
+class RecipeCreateTests(APITestCase):
+    """Creating a recipe is a fixed number of queries and all or nothing."""
+
+    INGREDIENTS = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients += Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(cls.INGREDIENTS - len(cls.ingredients))
+        )
+
+        encoded = base64.b64encode(cls.make_image()).decode()
+        cls.image = f'data:image/png;base64,{encoded}'
+
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_media()
+
+    def post_recipe(self, ingredient_ids):
+        return self.client.post('/api/recipes/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': ingredient_id, 'amount': 10}
+                            for ingredient_id in ingredient_ids],
+            'name': 'Блины',
+            'image': self.image,
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+
+    def test_query_count_does_not_grow_with_ingredients(self):
+        ingredient_ids = [ingredient.id for ingredient in self.ingredients]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.post_recipe(ingredient_ids[:1])
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.post_recipe(ingredient_ids)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['ingredients']),
+                         self.INGREDIENTS)
+        self.assertEqual(RecipeIngredientAmount.objects.filter(
+            recipe_id=response.json()['id']).count(), self.INGREDIENTS)
+
+    def test_unknown_ingredient_creates_nothing(self):
+        response = self.post_recipe([self.ingredients[0].id, 0])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failed_ingredient_insert_rolls_back(self):
+        ingredient_ids = [ingredient.id for ingredient in self.ingredients]
+
+        with mock.patch.object(RecipeIngredientAmount.objects, 'bulk_create',
+                               side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.post_recipe(ingredient_ids)
+
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+        self.assertFalse(RecipeIngredientAmount.objects.exists())
+
+
+class BulkRelationTests(APITestCase):
+    """A bulk add or remove is a fixed number of queries."""
+
+    SIZE = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe_ids = [
+            cls.create_recipe(f'Рецепт {index}').id
+            for index in range(cls.SIZE)
+        ]
+        cls.author_ids = [
+            cls.create_user(f'author{index}').id for index in range(cls.SIZE)
+        ]
+
+    def assertConsistent(self):
+        self.assertEqual(set(reconcile_counters().values()), {0})
+        self.assertEqual(get_stored_totals(), compute_totals())
+
+    def change(self, method, url, ids):
+        response = getattr(self.client, method)(url, {'ids': ids},
+                                                format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_query_count_does_not_grow_with_batch(self):
+        for url, ids in (('/api/recipes/favorite/', self.recipe_ids),
+                         ('/api/recipes/shopping_cart/', self.recipe_ids),
+                         ('/api/users/subscriptions/', self.author_ids)):
+            for method, status in (('post', 'added'), ('delete', 'removed')):
+                with self.subTest(url=url, method=method):
+                    with CaptureQueriesContext(connection) as context:
+                        self.change(method, url, ids[:1])
+
+                    with self.assertNumQueries(len(context.captured_queries)):
+                        results = self.change(method, url, ids[1:])
+                    self.assertEqual({item['status'] for item in results},
+                                     {status})
+                    self.assertConsistent()
+
+    def test_cart_totals_of_recipes_sharing_ingredients(self):
+        self.change('post', '/api/recipes/shopping_cart/',
+                    self.recipe_ids[:10])
+        self.change('delete', '/api/recipes/shopping_cart/',
+                    self.recipe_ids[5:10])
+
+        flour, milk = (ingredient.id for ingredient in self.ingredients[:2])
+        self.assertEqual(get_stored_totals(), {
+            (self.user.id, flour): 200 * 5, (self.user.id, milk): 300 * 5,
+        })
+        self.assertConsistent()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL plans')
+class UserRecipeFilterPlanTests(APITestCase):
+    """Favorite and cart filters start from the viewer's own rows."""
+
+    RECIPES = 20000
+    SELECTED = 20
+    READERS = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'Рецепт {index}',
+                   cooking_time=10)
+            for index in range(cls.RECIPES)
+        )
+        readers = User.objects.bulk_create(
+            User(username=f'reader{index}', email=f'reader{index}@example.com')
+            for index in range(cls.READERS)
+        )
+        selected = recipes[::cls.RECIPES // cls.SELECTED]
+        for model in (FavoriteRecipe, ShoppingCartRecipe):
+            model.objects.bulk_create(
+                model(user=cls.user, recipe=recipe) for recipe in selected)
+            # Other readers make the link tables large as well.
+            model.objects.bulk_create(
+                model(user=reader, recipe=recipe)
+                for index, reader in enumerate(readers)
+                for recipe in recipes[index::cls.READERS]
+            )
+
+        with connection.cursor() as cursor:
+            for model in (Recipe, FavoriteRecipe, ShoppingCartRecipe):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def get_plans(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.SELECTED)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                # The paginator's own count estimate is an EXPLAIN already.
+                if sql.startswith('EXPLAIN'):
+                    continue
+                if Recipe._meta.db_table not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN {sql}')
+                plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+        return plans
+
+    def test_filters_do_not_scan_whole_tables(self):
+        for param, model in (('is_favorited', FavoriteRecipe),
+                             ('is_in_shopping_cart', ShoppingCartRecipe)):
+            with self.subTest(param=param):
+                plans = self.get_plans(f'/api/recipes/?{param}=1&limit=6')
+
+                self.assertTrue(plans)
+                for plan, table in product(plans, (Recipe, model)):
+                    self.assertNotRegex(
+                        plan, rf'Seq Scan on {table._meta.db_table}\b')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs concurrent writers')
+class ConcurrentToggleTests(TransactionTestCase):
+    """Parallel toggles keep rows, counters and cart totals in step."""
+
+    READERS = 8
+    RECIPES = 3
+    ROUNDS = 6
+    WORKERS = 16
+
+    def setUp(self):
+        cache.clear()
+        self.author = APITestCase.create_user('author')
+        ingredient = Ingredient.objects.create(name='мука',
+                                               measurement_unit='г')
+        self.recipes = [
+            Recipe.objects.create(author=self.author, name=f'Рецепт {index}',
+                                  cooking_time=10)
+            for index in range(self.RECIPES)
+        ]
+        RecipeIngredientAmount.objects.bulk_create(
+            RecipeIngredientAmount(recipe=recipe, ingredient=ingredient,
+                                   amount=100)
+            for recipe in self.recipes
+        )
+        self.tokens = [
+            Token.objects.create(
+                user=APITestCase.create_user(f'reader{index}')).key
+            for index in range(self.READERS)
+        ]
+
+    def get_requests(self):
+        urls = [f'/api/users/{self.author.id}/subscribe/']
+        for recipe in self.recipes:
+            urls += [f'/api/recipes/{recipe.id}/favorite/',
+                     f'/api/recipes/{recipe.id}/shopping_cart/']
+
+        requests = [
+            (token, method, url)
+            for token, url in product(self.tokens, urls)
+            for method in ('post', 'delete') * self.ROUNDS
+        ]
+        Random(0).shuffle(requests)
+        return requests
+
+    @staticmethod
+    def toggle(token, method, url):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        try:
+            return getattr(client, method)(url).status_code
+        finally:
+            # Each worker thread opens its own connection.
+            connection.close()
+
+    def test_parallel_toggles(self):
+        requests = self.get_requests()
+        self.assertGreater(len(requests), 500)
+
+        with ThreadPoolExecutor(self.WORKERS) as executor:
+            codes = list(executor.map(lambda args: self.toggle(*args),
+                                      requests))
+
+        self.assertLessEqual(set(codes), {200, 204, 400})
+        self.assertEqual(set(reconcile_counters().values()), {0})
+        self.assertEqual(get_stored_totals(), compute_totals())
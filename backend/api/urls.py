@@ -16,6 +16,8 @@ urlpatterns = [
          SubscriptionViewSet.as_view(
              {
                  'get': 'get_subscriptions',
+                 'post': 'bulk_add',
+                 'delete': 'bulk_remove'
              }
          ), name='user-subscriptions'),
     path('users/<int:pk>/subscribe/',
@@ -26,13 +28,22 @@ urlpatterns = [
              }
          ), name='user-subscribe'),
 
-    path('recipes/download_shopping_cart/',
-         RecipeCRUDViewSet.as_view(
+    path('recipes/favorite/',
+         RecipeFavoritesViewSet.as_view(
              {
-                 'get': 'download_shopping_cart',
+                 'post': 'bulk_add',
+                 'delete': 'bulk_remove'
              }
-         ), name='recipe-download-shopping-cart'),
-
+         ),
+         name='recipe-favorite-bulk'),
+    path('recipes/shopping_cart/',
+         RecipeShoppingCartViewSet.as_view(
+             {
+                 'post': 'bulk_add',
+                 'delete': 'bulk_remove'
+             }
+         ),
+         name='recipe-shopping-cart-bulk'),
     path('recipes/<int:pk>/favorite/',
          RecipeFavoritesViewSet.as_view(
              {
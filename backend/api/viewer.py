@@ -0,0 +1,77 @@
+from bisect import bisect_left
+
+from recipes.models import FavoriteRecipe, ShoppingCartRecipe, Subscription
+from .caches import get_recipe_ids
+
+
+class RecipeIdSet:
+    """Membership test over a sorted array of recipe ids."""
+
+    def __init__(self, recipe_ids=()):
+        self.recipe_ids = recipe_ids
+
+    def __contains__(self, recipe_id):
+        index = bisect_left(self.recipe_ids, recipe_id)
+
+        if index == len(self.recipe_ids):
+            return False
+        return self.recipe_ids[index] == recipe_id
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+
+def get_followed_author_ids(request):
+    """Ids of the authors the viewer follows, loaded once per request."""
+    user = request.user
+
+    if not user.is_authenticated:
+        return frozenset()
+
+    if not hasattr(request, 'followed_author_ids'):
+        request.followed_author_ids = frozenset(
+            Subscription.objects.filter(
+                subscriber=user).values_list('user_id', flat=True))
+
+    return request.followed_author_ids
+
+
+def get_user_recipe_ids(request, name, model):
+    user = request.user
+
+    if not user.is_authenticated:
+        return RecipeIdSet()
+
+    if not hasattr(request, 'user_recipe_ids'):
+        request.user_recipe_ids = {}
+
+    if name not in request.user_recipe_ids:
+        request.user_recipe_ids[name] = RecipeIdSet(get_recipe_ids(
+            f'{name}:{user.id}',
+            model.objects.filter(user=user).order_by(
+                'recipe_id').values_list('recipe_id', flat=True)
+        ))
+
+    return request.user_recipe_ids[name]
+
+
+def get_favorite_recipe_ids(request):
+    return get_user_recipe_ids(request, 'favorites', FavoriteRecipe)
+
+
+def get_cart_recipe_ids(request):
+    return get_user_recipe_ids(request, 'shopping_cart', ShoppingCartRecipe)
+
+
+def get_viewer_flags(request, recipe_id):
+    """``is_favorited``/``is_in_shopping_cart`` of a recipe for the viewer.
+
+    Anonymous viewers get no flags, matching the recipe list output.
+    """
+    if not request.user.is_authenticated:
+        return {}
+
+    return {
+        'is_favorited': recipe_id in get_favorite_recipe_ids(request),
+        'is_in_shopping_cart': recipe_id in get_cart_recipe_ids(request),
+    }
@@ -1,31 +1,51 @@
-from io import BytesIO
-
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from django.http import FileResponse
-from django.db.models import Exists, OuterRef
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db.models import Prefetch, Value
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            ShoppingCartRecipe, Tag, User)
+                            RecipeIngredientAmount, ShoppingCartRecipe,
+                            Subscription, Tag, User)
+from recipes.relations import add_relation, remove_relation
+from .caches import (get_recipe_fragment_keys, get_recipe_fragments,
+                     is_export_pending, make_count_key, set_recipe_fragments)
+from .constants import (EXPORT_RETRY_AFTER, SHOPPING_LIST_FILENAME,
+                        SHOPPING_LIST_TITLE)
+from .exports import get_export, start_export
 from .filters import IngredientFilter, RecipeFilter
+from .indexes import ingredient_index, ingredient_trigram_index
+from .mixins import BulkRelationMixin, ConditionalGetMixin
 from .paginations import CustomPagination
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                        ShoppingListPDFRenderer, ShoppingListTextRenderer,
+                        format_shopping_list_line, render_pdf)
 from .serializers import (CustomUserCreateSerializer, CustomUserSerializer,
                           IngredientSerializer, RecipeCreateUpdateSerializer,
                           RecipeFavoritesSerializer, RecipeListSerializer,
                           RecipeShoppingSerializer,
                           SubscriptionCreateDeleteSerializer,
                           SubscriptionListSerializer, TagSerializer)
+from .shopping_list import get_shopping_list, get_shopping_list_lines
+from .viewer import get_followed_author_ids, get_viewer_flags
+
+
+class CustomUserViewSet(ConditionalGetMixin, UserViewSet):
+    conditional_actions = ('retrieve', 'me')
 
+    def get_condition_key(self):
+        user = self.request.user
+        user_id = self.kwargs.get('id', user.id)
+
+        return [f'user:{user_id}', f'subscriptions:{user.id}'], [user_id]
 
-class CustomUserViewSet(UserViewSet):
     def get_serializer_class(self):
         if self.action == 'create':
             return CustomUserCreateSerializer
@@ -41,7 +61,7 @@ class CustomUserViewSet(UserViewSet):
         return [IsAuthenticated()]
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [IsAuthorOrReadOnly]
@@ -49,140 +69,260 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ['name']
 
+    def get_condition_key(self):
+        return ['ingredients'], [self.request.get_full_path()]
+
+    def list(self, request, *args, **kwargs):
+        if 'search' in request.query_params:
+            return super().list(request, *args, **kwargs)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+        name = request.query_params.get('name', '')
+        ingredients = ingredient_index.search(name)
+
+        if name and request.query_params.get('fuzzy') == '1':
+            found_ids = {ingredient['id'] for ingredient in ingredients}
+            ingredients += [
+                ingredient
+                for ingredient in ingredient_trigram_index.search(name)
+                if ingredient['id'] not in found_ids
+            ]
+
+        return Response(ingredients)
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAuthorOrReadOnly]
 
+    def get_condition_key(self):
+        return ['tags'], [self.request.get_full_path()]
+
 
-class RecipeCRUDViewSet(viewsets.ModelViewSet):
+class RecipeCRUDViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrReadOnly]
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
-    def get_queryset(self):
+    def get_condition_key(self):
         user = self.request.user
-        queryset = Recipe.objects.all()
+        version_names = ['recipe_fragments']
+
+        if self.action == 'retrieve':
+            version_names.append(f'recipe:{self.kwargs["pk"]}')
+        else:
+            version_names.append('recipe_list')
 
         if user.is_authenticated:
-            favorited_by_user_subquery = FavoriteRecipe.objects.filter(
-                recipe=OuterRef('pk'),
-                user=user
-            ).values('recipe')
-
-            in_shopping_cart_subquery = ShoppingCartRecipe.objects.filter(
-                recipe=OuterRef('pk'),
-                user=user
-            ).values('recipe')
-
-            queryset = queryset.annotate(
-                is_favorited=Exists(favorited_by_user_subquery),
-                is_in_shopping_cart=Exists(in_shopping_cart_subquery)
-            )
-        return queryset
+            version_names += [f'favorites:{user.id}',
+                              f'shopping_cart:{user.id}',
+                              f'subscriptions:{user.id}']
+
+        return version_names, [user.id, self.request.get_full_path()]
 
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH', 'DELETE']:
             return RecipeCreateUpdateSerializer
         return RecipeListSerializer
 
+    def get_count_key(self):
+        user = self.request.user
+        params = self.request.query_params
+        version_names = ['recipes']
+        parts = [sorted(set(params.getlist('tags'))), params.get('author'),
+                 params.get('search')]
+
+        if params.get('search'):
+            version_names.append('recipe_list')
+
+        for param, name in (('is_favorited', 'favorites'),
+                            ('is_in_shopping_cart', 'shopping_cart')):
+            if params.get(param) != '1':
+                parts.append(None)
+            elif user.is_authenticated:
+                version_names.append(f'{name}:{user.id}')
+                parts.append(user.id)
+            else:
+                parts.append('anonymous')
+
+        return make_count_key(version_names, 'recipes', *parts)
+
+    def get_recipe_rows(self, queryset):
+        return queryset.values('id', 'author_id')
+
+    def render_recipes(self, rows):
+        keys = get_recipe_fragment_keys([row['id'] for row in rows])
+        fragments = get_recipe_fragments(keys)
+        missing_ids = [row['id'] for row in rows if row['id'] not in fragments]
+
+        if missing_ids:
+            recipes = Recipe.objects.filter(
+                id__in=missing_ids
+            ).select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'recipe_ingredient_amounts',
+                    queryset=RecipeIngredientAmount.objects.select_related(
+                        'ingredient')
+                )
+            )
+            rendered = {
+                recipe.id: RecipeListSerializer.get_fragment(recipe)
+                for recipe in recipes
+            }
+            set_recipe_fragments(keys, rendered)
+            fragments.update(rendered)
+
+        followed_author_ids = get_followed_author_ids(self.request)
+
+        return [
+            RecipeListSerializer.add_viewer_fields(
+                fragments[row['id']],
+                row['author_id'] in followed_author_ids,
+                get_viewer_flags(self.request, row['id'])
+            )
+            for row in rows
+        ]
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_recipe_rows(
+            self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+
+        if page is not None:
+            return self.get_paginated_response(self.render_recipes(page))
+
+        return Response(self.render_recipes(list(rows)))
+
+    def retrieve(self, request, *args, **kwargs):
+        row = get_object_or_404(
+            self.get_recipe_rows(self.get_queryset()), pk=kwargs['pk'])
+        self.check_object_permissions(request, row)
+
+        return Response(self.render_recipes([row])[0])
+
     @action(detail=False, methods=['GET'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[ShoppingListPDFRenderer,
+                              ShoppingListCSVRenderer,
+                              ShoppingListTextRenderer,
+                              ShoppingListJSONRenderer])
     def download_shopping_cart(self, request):
-        pdfmetrics.registerFont(TTFont('DejaVuSerif', 'DejaVuSerif.ttf'))
+        renderer = request.accepted_renderer
+        rows = get_shopping_list(request.user).iterator()
+        filename = SHOPPING_LIST_FILENAME.format(format=renderer.format)
+
+        if renderer.format == ShoppingListPDFRenderer.format:
+            lines = (format_shopping_list_line(*row) for row in rows)
+            return FileResponse(
+                render_pdf(SHOPPING_LIST_TITLE, lines), as_attachment=True,
+                filename=filename)
+
+        response = StreamingHttpResponse(
+            renderer.stream(SHOPPING_LIST_TITLE, rows),
+            content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['POST'],
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_exports(self, request):
+        export_id = start_export(
+            SHOPPING_LIST_TITLE, get_shopping_list_lines(request.user))
 
-        recipes = ShoppingCartRecipe.objects.filter(user=request.user)
+        return self.get_export_response(export_id)
 
-        ingredients_dict = {}
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated],
+            url_path=r'shopping_cart_exports/(?P<export_id>[0-9a-f]{64})')
+    def shopping_cart_export(self, request, export_id):
+        path = get_export(export_id)
 
-        for recipe in recipes:
-            for amount in recipe.recipe.recipe_ingredient_amounts.all():
-                ingredient_name = amount.ingredient.name
-                measurement_unit = amount.ingredient.measurement_unit
-                total_amount = amount.amount
+        if path is not None:
+            return FileResponse(
+                open(path, 'rb'), as_attachment=True,
+                filename=SHOPPING_LIST_FILENAME.format(format='pdf'))
 
-                if ingredient_name in ingredients_dict:
-                    ingredients_dict[ingredient_name][0] += total_amount
-                else:
-                    ingredients_dict[ingredient_name] = [
-                        total_amount, measurement_unit
-                    ]
+        if not is_export_pending(export_id):
+            raise Http404
 
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer)
+        return self.get_export_response(export_id)
 
-        c.setFont('DejaVuSerif', 12)
+    def finalize_response(self, request, response, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        is_download = self.action == 'download_shopping_cart'
+        is_error = getattr(response, 'exception', False)
 
-        c.drawString(100, 800, 'Список покупок:')
-        y_position = 780
+        if is_download and is_error and not hasattr(renderer, 'stream'):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
 
-        for ingredient_name, data in ingredients_dict.items():
-            text = f'{ingredient_name}: {data[0]} {data[1]}'
-            c.drawString(100, y_position, text)
-            y_position -= 20
+        return super().finalize_response(request, response, *args, **kwargs)
 
-        c.save()
+    def get_export_response(self, export_id):
+        location = self.request.build_absolute_uri(reverse(
+            'recipes-shopping-cart-export', kwargs={'export_id': export_id}))
 
-        buffer.seek(0)
+        if get_export(export_id) is not None:
+            return Response({'id': export_id, 'status': 'ready'},
+                            headers={'Location': location})
 
-        response = FileResponse(
-            buffer, as_attachment=True, filename='shopping_cart.pdf')
-        return response
+        return Response({'id': export_id, 'status': 'pending'},
+                        status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': location,
+                                 'Retry-After': str(EXPORT_RETRY_AFTER)})
 
 
-class RecipeFavoritesViewSet(viewsets.ModelViewSet):
+class RecipeFavoritesViewSet(BulkRelationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticated]
     serializer_class = RecipeFavoritesSerializer
+    relation_model = FavoriteRecipe
+    relation_field = 'recipe_id'
 
     @action(detail=True, methods=['POST'],
             )
     def add_to_favorites(self, request, pk=None):
-        data = {
-            'recipe': self.get_object().id,
-            'user': request.user.id
-        }
-        serializer = self.get_serializer(data=data)
-
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data,
+        recipe = self.get_object()
+        favorite = add_relation(FavoriteRecipe, 'recipe_id', recipe.id,
+                                user_id=request.user.id)
+
+        if favorite:
+            favorite.recipe = recipe
+            return Response(self.get_serializer(favorite).data,
                             status=status.HTTP_200_OK)
 
-        return Response({'message': serializer.errors},
+        return Response({'message': 'Этот рецепт уже добавлен в избранное.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['DELETE'])
     def remove_from_favorites(self, request, pk=None):
-        favorited_recipe = request.user.favorite_recipes.get(
-            recipe=self.get_object())
-
-        if favorited_recipe:
-            favorited_recipe.delete()
+        if remove_relation(FavoriteRecipe, 'recipe_id', self.get_object().id,
+                           user_id=request.user.id):
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response({'message': 'Ошибка удаления из избранного'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class RecipeShoppingCartViewSet(viewsets.ModelViewSet):
+class RecipeShoppingCartViewSet(BulkRelationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthenticated]
     serializer_class = RecipeShoppingSerializer
+    relation_model = ShoppingCartRecipe
+    relation_field = 'recipe_id'
 
     @action(detail=True, methods=['POST'])
     def add_to_shopping_cart(self, request, pk=None):
-        data = {
-            'recipe': self.get_object().id,
-            'user': request.user.id
-        }
-        serializer = self.get_serializer(data=data)
-
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data,
+        recipe = self.get_object()
+        cart_recipe = add_relation(ShoppingCartRecipe, 'recipe_id', recipe.id,
+                                   user_id=request.user.id)
+
+        if cart_recipe:
+            cart_recipe.recipe = recipe
+            return Response(self.get_serializer(cart_recipe).data,
                             status=status.HTTP_200_OK)
 
         return Response({'message': 'Ошибка добавления в список покупок'},
@@ -190,43 +330,71 @@ class RecipeShoppingCartViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['DELETE'])
     def remove_from_shopping_cart(self, request, pk=None):
-        favorited_recipe = request.user.shopping_cart_recipes.get(
-            recipe=self.get_object())
-
-        if favorited_recipe:
-            favorited_recipe.delete()
+        if remove_relation(ShoppingCartRecipe, 'recipe_id',
+                           self.get_object().id, user_id=request.user.id):
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response({'message': 'Ошибка удаления из карзины'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
+class SubscriptionViewSet(BulkRelationMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
+    relation_model = Subscription
+    relation_field = 'user_id'
+    owner_field = 'subscriber_id'
 
     def get_serializer_class(self):
         if self.request.method in ['POST', 'DELETE']:
             return SubscriptionCreateDeleteSerializer
         return SubscriptionListSerializer
 
+    def get_count_key(self):
+        user_id = self.request.user.id
+
+        return make_count_key(
+            [f'subscriptions:{user_id}'], 'subscriptions', user_id)
+
+    def get_valid_ids(self, ids):
+        return super().get_valid_ids(ids) - {self.request.user.id}
+
+    def get_recipes_limit(self):
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+
+        return recipes_limit if recipes_limit > 0 else None
+
     @action(detail=False, methods=['GET'])
     def get_subscriptions(self, request):
+        recipes_limit = self.get_recipes_limit()
+        latest_recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'image_variants',
+            'cooking_time'
+        ).order_by('-id')
+
+        if recipes_limit is not None:
+            latest_recipes = latest_recipes[:recipes_limit]
+
         subscriptions = User.objects.filter(
-            subscriptions_as_user__subscriber=request.user)
+            subscriptions_as_user__subscriber=request.user
+        ).annotate(
+            is_subscribed=Value(True)
+        ).prefetch_related(
+            Prefetch('recipes', queryset=latest_recipes,
+                     to_attr='latest_recipes')
+        ).order_by('-id')
 
         page = self.paginate_queryset(subscriptions)
 
         if page is not None:
-            recipes_limit = int(self.request.query_params.get('recipes_limit'))
             serializer = SubscriptionListSerializer(
                 page,
                 many=True,
-                context={
-                    'request': request,
-                    'recipes_limit': recipes_limit
-                }
+                context={'request': request}
             )
             return self.get_paginated_response(serializer.data)
 
@@ -234,15 +402,16 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['POST'])
     def add_to_subscriptions(self, request, pk=None):
-        data = {
-            'user': self.get_object().id,
-            'subscriber': request.user.id
-        }
-        serializer = self.get_serializer(data=data)
-
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data,
+        author = self.get_object()
+        subscription = None
+
+        if author != request.user:
+            subscription = add_relation(Subscription, 'user_id', author.id,
+                                        subscriber_id=request.user.id)
+
+        if subscription:
+            subscription.user = author
+            return Response(self.get_serializer(subscription).data,
                             status=status.HTTP_200_OK)
 
         return Response({'message': 'Ошибка подписки'},
@@ -250,12 +419,9 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['DELETE'])
     def remove_from_subscriptions(self, request, pk=None):
-        subscribe = self.get_object().subscriptions_as_user.get(
-            subscriber=request.user)
-
-        if subscribe:
-            subscribe.delete()
+        if remove_relation(Subscription, 'user_id', self.get_object().id,
+                           subscriber_id=request.user.id):
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-        return Response({'message': 'Ошибка удаления из карзины'},
+        return Response({'message': 'Ошибка удаления подписки'},
                         status=status.HTTP_400_BAD_REQUEST)
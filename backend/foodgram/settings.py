@@ -75,6 +75,24 @@ DATABASES = {
     }
 }
 
+# Cached fragments, counts and data versions must be shared by every
+# process, including management commands, so production uses Redis.
+# Without REDIS_URL, e.g. in a local test run, a per-process cache is used.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
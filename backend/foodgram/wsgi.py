@@ -7,10 +7,25 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from api.indexes import (ingredient_index,  # noqa: E402
+                         ingredient_trigram_index)
+
+try:
+    ingredient_index.build()
+    ingredient_trigram_index.build()
+except DatabaseError:
+    # The indexes build on the first search instead.
+    logger.warning('Ingredient indexes were not built at startup',
+                   exc_info=True)
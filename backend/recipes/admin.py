@@ -64,6 +64,7 @@ class RecipeAdminForm(forms.ModelForm):
 
 
 class RecipeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'author', 'favorites_count', 'carts_count')
     list_filter = ('author', 'tags', 'name')
     search_fields = ('author__username', 'tags__name', 'name')
     inlines = [RecipeIngredientAmountInline]
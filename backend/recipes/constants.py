@@ -35,3 +35,28 @@ MAX_SLUG_LENGTH = 50
 MIN_COOKING_TIME_VALUE = 1
 MIN_INGREDIENT_AMOUNT = 1
 START_INGREDIENT_AMOUNT_FORMS = 0
+SEARCH_CONFIG = 'russian'
+SEARCH_WEIGHTS = {'name': 'A', 'text': 'B', 'ingredients': 'C'}
+SEARCH_WEIGHT_VALUES = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+SEARCH_MIN_STEM_LENGTH = 3
+SEARCH_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ией', 'ого', 'его', 'ому',
+    'ему', 'ыми', 'ими', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ов', 'ев', 'ам', 'ям', 'ом', 'ем', 'ую', 'юю', 'ию', 'ия',
+    'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+    'ст. л.': ('ч. л.', 3),
+}
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_VARIANTS_DIR = 'media/recipes/variants/'
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_EXTENSION = 'webp'
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_WORKERS = 2
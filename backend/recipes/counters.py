@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import (Case, Count, F, IntegerField, OuterRef,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import (FavoriteRecipe, Recipe, ShoppingCartRecipe,
+                     Subscription, User)
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'user'),
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCartRecipe, 'recipe'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Atomically add ``delta`` to a counter without going below zero."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+def change_counters(model, field, deltas):
+    """Add ``{pk: delta}`` to a counter of many rows in one UPDATE."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    delta = Case(
+        *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+        default=Value(0), output_field=IntegerField())
+    rows = model.objects.filter(pk__in=deltas)
+    with transaction.atomic():
+        # The UPDATE locks rows in no particular order: take the locks in
+        # pk order first so overlapping batches wait instead of deadlocking.
+        list(rows.select_for_update(no_key=True).order_by(
+            'pk').values_list('pk', flat=True))
+        rows.update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def get_actual_count(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), Value(0))
+
+
+def reconcile_counters():
+    """Fix counters that drifted from their rows; return fix counts."""
+    fixed = {}
+
+    for model, field, related_model, related_field in COUNTERS:
+        actual_count = get_actual_count(related_model, related_field)
+        fixed[f'{model.__name__}.{field}'] = model.objects.annotate(
+            actual_count=actual_count
+        ).exclude(
+            **{field: F('actual_count')}
+        ).update(**{field: actual_count})
+
+    return fixed
@@ -0,0 +1,126 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .constants import (IMAGE_VARIANT_EXTENSION, IMAGE_VARIANT_FORMAT,
+                        IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS,
+                        IMAGE_VARIANTS_DIR, IMAGE_WORKERS)
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+ALPHA_MODES = ('RGBA', 'LA', 'PA')
+
+# Sent with ``instance=recipe`` after new image variants were attached.
+recipe_image_variants_changed = Signal()
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+
+
+def has_current_variants(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') == recipe.image.name)
+
+
+def get_image_variants(recipe):
+    """Return ``{variant: {url, width, height}}`` of the current image.
+
+    Empty until the variants of the current image have been made.
+    """
+    if not has_current_variants(recipe):
+        return {}
+
+    return {
+        name: {
+            'url': default_storage.url(variant['name']),
+            'width': variant['width'],
+            'height': variant['height'],
+        }
+        for name, variant in recipe.image_variants.items()
+        if name in IMAGE_VARIANTS
+    }
+
+
+def render_variants(source):
+    """Save resized WebP copies of a stored image; return their info."""
+    variants = {'source': source}
+    stem = PurePosixPath(source).stem
+
+    with default_storage.open(source) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ALPHA_MODES or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        for name, size in IMAGE_VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail(size, Image.Resampling.LANCZOS)
+            content = BytesIO()
+            variant.save(content, IMAGE_VARIANT_FORMAT,
+                         quality=IMAGE_VARIANT_QUALITY, method=6)
+            variants[name] = {
+                'name': default_storage.save(
+                    f'{IMAGE_VARIANTS_DIR}{stem}_{name}.'
+                    f'{IMAGE_VARIANT_EXTENSION}',
+                    ContentFile(content.getvalue())),
+                'width': variant.width,
+                'height': variant.height,
+            }
+
+    return variants
+
+
+def delete_variants(variants):
+    for name in IMAGE_VARIANTS:
+        if name in variants:
+            default_storage.delete(variants[name]['name'])
+
+
+def make_image_variants(recipe_id, source):
+    """Render the variants of ``source`` and attach them to the recipe.
+
+    The row is only updated if the recipe still has that image, so a
+    newer upload is never overwritten by an older job. ``update()`` sends
+    no ``post_save``, hence ``recipe_image_variants_changed``.
+    """
+    try:
+        old_variants = Recipe.objects.filter(
+            pk=recipe_id, image=source
+        ).values_list('image_variants', flat=True).first()
+        if old_variants is None or old_variants.get('source') == source:
+            return
+
+        variants = render_variants(source)
+        if not Recipe.objects.filter(pk=recipe_id, image=source).update(
+                image_variants=variants):
+            delete_variants(variants)
+            return
+
+        delete_variants(old_variants)
+        recipe_image_variants_changed.send(
+            sender=Recipe,
+            instance=Recipe(pk=recipe_id, image=source,
+                            image_variants=variants))
+    except Exception:
+        logger.exception('Image variants of recipe %s failed', recipe_id)
+
+
+def run_image_variants(recipe_id, source):
+    close_old_connections()
+    try:
+        make_image_variants(recipe_id, source)
+    finally:
+        close_old_connections()
+
+
+def start_image_variants(recipe):
+    """Queue variants of the recipe's image unless they are current."""
+    if recipe.image and not has_current_variants(recipe):
+        executor.submit(run_image_variants, recipe.pk, recipe.image.name)
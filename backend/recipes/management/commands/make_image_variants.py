@@ -0,0 +1,30 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from recipes.images import has_current_variants, make_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Make missing or outdated image variants of recipes'
+
+    def handle(self, *args, **kwargs):
+        made = 0
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('id', 'image', 'image_variants')
+
+        for recipe in recipes.iterator():
+            if not has_current_variants(recipe):
+                make_image_variants(recipe.pk, recipe.image.name)
+                made += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Image variants made for {made} recipes'))
+
+        # Invalidations go through the cache, so a running server only
+        # sees them if it shares the cache with this process.
+        if made and isinstance(caches['default'], LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                'The cache is local to this process: running servers keep '
+                'cached recipes without the new variants. Set REDIS_URL.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.totals import compute_totals, get_stored_totals, rebuild_totals
+
+
+class Command(BaseCommand):
+    help = 'Rebuild shopping cart totals or verify them against a recompute'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare stored totals with a full recompute')
+
+    def handle(self, *args, **kwargs):
+        if not kwargs['verify']:
+            rebuild_totals()
+            self.stdout.write(self.style.SUCCESS('Totals rebuilt'))
+            return
+
+        expected = compute_totals()
+        stored = get_stored_totals()
+        mismatches = sorted(
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        )
+
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'stored={stored.get((user_id, ingredient_id))} '
+                f'expected={expected.get((user_id, ingredient_id))}')
+
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} totals are out of date')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(stored)} totals are up to date'))
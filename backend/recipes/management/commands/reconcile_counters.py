@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized counters and fix the ones that drifted'
+
+    def handle(self, *args, **kwargs):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(f'{counter}: {fixed} fixed')
+
+        self.stdout.write(self.style.SUCCESS('Counters reconciled'))
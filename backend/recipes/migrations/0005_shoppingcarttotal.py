@@ -0,0 +1,52 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_totals(apps, schema_editor):
+    RecipeIngredientAmount = apps.get_model(
+        'recipes', 'RecipeIngredientAmount')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+
+    amounts = RecipeIngredientAmount.objects.filter(
+        recipe__shopping_cart_recipes__isnull=False
+    ).values_list(
+        'recipe__shopping_cart_recipes__user', 'ingredient'
+    ).annotate(total_amount=models.Sum('amount')).order_by()
+
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+        for user_id, ingredient_id, amount in amounts.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0004_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_shopping_cart_total'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.3 on 2026-10-18 20:30
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('users', 'User', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'User', 'subscribers_count', 'Subscription', 'user'),
+    ('recipes', 'Recipe', 'favorites_count', 'FavoriteRecipe', 'recipe'),
+    ('recipes', 'Recipe', 'carts_count', 'ShoppingCartRecipe', 'recipe'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app_label, model_name, field, related_name, related_field in COUNTERS:
+        model = apps.get_model(app_label, model_name)
+        related_model = apps.get_model('recipes', related_name)
+        count = related_model.objects.filter(
+            **{related_field: models.OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            count=models.Count('pk')
+        ).values('count')
+
+        model.objects.update(
+            **{field: Coalesce(models.Subquery(count), models.Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppingcarttotal'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
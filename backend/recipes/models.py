@@ -1,8 +1,10 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from users.mixins import CounterFieldsMixin
 
 from .constants import (MAX_MEASUREMENT_UNIT_LENGTH, MAX_NAME_LENGTH,
                         MAX_SLUG_LENGTH, UNIT_CHOICES, MIN_COOKING_TIME_VALUE,
@@ -11,6 +13,18 @@ from .constants import (MAX_MEASUREMENT_UNIT_LENGTH, MAX_NAME_LENGTH,
 User = get_user_model()
 
 
+class AtomicSaveMixin:
+    """Run ``save()`` and its ``post_save`` receivers in one transaction.
+
+    Counters and totals maintained by the receivers are then committed
+    or rolled back together with the row itself.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
 class Ingredient(models.Model):
     name = models.CharField(
         max_length=MAX_NAME_LENGTH,
@@ -61,7 +75,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(AtomicSaveMixin, CounterFieldsMixin, models.Model):
     tags = models.ManyToManyField(
         Tag, related_name='recipes',
         verbose_name='Тэги'
@@ -83,6 +97,10 @@ class Recipe(models.Model):
         upload_to='media/recipes/images/',
         blank=False, null=True, verbose_name='Картинка'
     )
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Варианты картинки'
+    )
     text = models.TextField(
         default='', null=True, blank=True,
         verbose_name='Описание'
@@ -95,10 +113,25 @@ class Recipe(models.Model):
                 message='Время приготовления должно быть больше 0.')
         ]
     )
+    search_vector = SearchVectorField(
+        null=True, editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='В избранном'
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='В списках покупок'
+    )
+
+    counter_fields = ('favorites_count', 'carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        ordering = ('-id',)
 
     def __str__(self):
         return self.name
@@ -141,7 +174,7 @@ class RecipeIngredientAmount(models.Model):
         return f'{self.recipe.name} - {self.ingredient.name}'
 
 
-class FavoriteRecipe(models.Model):
+class FavoriteRecipe(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -167,7 +200,7 @@ class FavoriteRecipe(models.Model):
         return f'{self.user.username} - {self.recipe.name}'
 
 
-class ShoppingCartRecipe(models.Model):
+class ShoppingCartRecipe(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -193,7 +226,34 @@ class ShoppingCartRecipe(models.Model):
         return f'{self.user.username} - {self.recipe.name}'
 
 
-class Subscription(models.Model):
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_shopping_cart_total')
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.ingredient.name}'
+
+
+class Subscription(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
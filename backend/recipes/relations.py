@@ -0,0 +1,157 @@
+from django.db import connection, transaction
+
+from .models import Recipe, RecipeIngredientAmount
+from .signals import recipe_ingredients_changed, relations_changed
+
+
+def get_fields(model, names):
+    return [model._meta.get_field(name) for name in names]
+
+
+def quote_columns(fields):
+    return ', '.join(connection.ops.quote_name(field.column)
+                     for field in fields)
+
+
+def get_params(fields, values):
+    return [field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, values)]
+
+
+def add_relations(model, field, ids, **values):
+    """Insert link rows for many ``field`` values in one statement.
+
+    Runs ``INSERT ... ON CONFLICT DO NOTHING RETURNING``, so duplicates
+    are skipped, and sends ``relations_changed`` once for the inserted
+    rows in the same transaction so the receivers maintaining counters,
+    totals and cache versions see them. Returns the new instances by
+    ``field`` value.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+
+    meta = model._meta
+    quote_name = connection.ops.quote_name
+    fields = get_fields(model, [*values, field])
+    row = f'({", ".join(["%s"] * len(fields))})'
+    sql = (
+        f'INSERT INTO {quote_name(meta.db_table)} ({quote_columns(fields)}) '
+        f'VALUES {", ".join([row] * len(ids))} ON CONFLICT DO NOTHING '
+        f'RETURNING {quote_name(meta.pk.column)}, '
+        f'{quote_name(fields[-1].column)}'
+    )
+    params = []
+    for value in ids:
+        params += get_params(fields, [*values.values(), value])
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        instances = {value: model(pk=pk, **values, **{field: value})
+                     for pk, value in rows}
+        if instances:
+            relations_changed.send(
+                sender=model, instances=list(instances.values()),
+                created=True)
+
+    return instances
+
+
+def remove_relations(model, field, ids, **values):
+    """Delete link rows for many ``field`` values in one statement.
+
+    Runs ``DELETE ... RETURNING`` and sends ``relations_changed`` once
+    for the deleted rows in the same transaction. Returns the deleted
+    values.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return set()
+
+    meta = model._meta
+    quote_name = connection.ops.quote_name
+    fields = get_fields(model, [*values, field])
+    conditions = [f'{quote_name(value_field.column)} = %s'
+                  for value_field in fields[:-1]]
+    conditions.append(f'{quote_name(fields[-1].column)} IN '
+                      f'({", ".join(["%s"] * len(ids))})')
+    sql = (
+        f'DELETE FROM {quote_name(meta.db_table)} '
+        f'WHERE {" AND ".join(conditions)} '
+        f'RETURNING {quote_name(meta.pk.column)}, '
+        f'{quote_name(fields[-1].column)}'
+    )
+    params = get_params(fields, values.values())
+    params += get_params([fields[-1]] * len(ids), ids)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        if rows:
+            relations_changed.send(
+                sender=model, created=False, instances=[
+                    model(pk=pk, **values, **{field: value})
+                    for pk, value in rows
+                ])
+
+    return {value for _, value in rows}
+
+
+def add_relation(model, field, value, **values):
+    """Insert one link row; return it, or None if it already existed."""
+    return add_relations(model, field, [value], **values).get(value)
+
+
+def remove_relation(model, field, value, **values):
+    """Delete one link row; return whether it existed."""
+    return bool(remove_relations(model, field, [value], **values))
+
+
+def set_recipe_ingredients(recipe, amounts):
+    """Bring a recipe's ingredient amounts to ``amounts`` with bulk queries.
+
+    ``amounts`` maps ingredient ids to amounts. Only the rows that differ
+    are deleted, updated or inserted, and ``recipe_ingredients_changed``
+    is sent once if anything was written. Returns whether it was.
+    """
+    current = {
+        row.ingredient_id: row
+        for row in RecipeIngredientAmount.objects.filter(recipe=recipe)
+    }
+    removed = [row.pk for ingredient_id, row in current.items()
+               if ingredient_id not in amounts]
+    updated, created = [], []
+
+    for ingredient_id, amount in amounts.items():
+        row = current.get(ingredient_id)
+        if row is None:
+            created.append(RecipeIngredientAmount(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount))
+        elif row.amount != amount:
+            row.amount = amount
+            updated.append(row)
+
+    if not (removed or updated or created):
+        return False
+
+    meta = RecipeIngredientAmount._meta
+    quote_name = connection.ops.quote_name
+    with transaction.atomic():
+        if removed:
+            # A queryset delete would send post_delete for every row.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {quote_name(meta.db_table)} '
+                    f'WHERE {quote_name(meta.pk.column)} IN '
+                    f'({", ".join(["%s"] * len(removed))})',
+                    removed)
+        RecipeIngredientAmount.objects.bulk_update(updated, ['amount'])
+        RecipeIngredientAmount.objects.bulk_create(created)
+        recipe_ingredients_changed.send(sender=Recipe, instance=recipe)
+
+    return True
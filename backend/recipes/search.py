@@ -0,0 +1,159 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Case, F, OuterRef, Subquery, When
+
+from .constants import (SEARCH_CONFIG, SEARCH_ENDINGS, SEARCH_MIN_STEM_LENGTH,
+                        SEARCH_WEIGHT_VALUES, SEARCH_WEIGHTS)
+from .models import Recipe, RecipeIngredientAmount
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def stem(word):
+    for ending in SEARCH_ENDINGS:
+        stem_length = len(word) - len(ending)
+        if stem_length >= SEARCH_MIN_STEM_LENGTH and word.endswith(ending):
+            return word[:stem_length]
+    return word
+
+
+def get_terms(value):
+    value = (value or '').casefold().replace('ё', 'е')
+    return [stem(word) for word in WORD_PATTERN.findall(value)]
+
+
+class PostgresRecipeSearch:
+    """Full-text search over ``Recipe.search_vector``.
+
+    The vector holds the name, the description and the ingredient names
+    with decreasing weights and is matched through its GIN index.
+    """
+
+    def update(self, recipe_ids):
+        ingredient_names = RecipeIngredientAmount.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+
+        search_vector = SearchVector(
+            'name', weight=SEARCH_WEIGHTS['name'], config=SEARCH_CONFIG)
+        search_vector += SearchVector(
+            'text', weight=SEARCH_WEIGHTS['text'], config=SEARCH_CONFIG)
+        search_vector += SearchVector(
+            Subquery(ingredient_names),
+            weight=SEARCH_WEIGHTS['ingredients'], config=SEARCH_CONFIG)
+
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=search_vector)
+
+    def search(self, queryset, query):
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-id')
+
+
+class LocalRecipeSearch:
+    """In-process inverted index used where PostgreSQL is not available.
+
+    Meant for SQLite-based test runs: terms are stemmed with a light
+    suffix stripper and the index lives in the process that saved the
+    recipes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = None
+        self.documents = {}
+
+    def get_documents(self, recipe_ids=None):
+        recipes = Recipe.objects.prefetch_related('ingredients')
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+
+        documents = {}
+        for recipe in recipes:
+            weights = defaultdict(float)
+            for field_name, value in (
+                ('ingredients', ' '.join(
+                    ingredient.name
+                    for ingredient in recipe.ingredients.all())),
+                ('text', recipe.text),
+                ('name', recipe.name),
+            ):
+                weight = SEARCH_WEIGHT_VALUES[SEARCH_WEIGHTS[field_name]]
+                for term in get_terms(value):
+                    weights[term] = max(weights[term], weight)
+            documents[recipe.id] = dict(weights)
+
+        return documents
+
+    def index(self, documents):
+        for recipe_id, weights in documents.items():
+            for term in self.documents.pop(recipe_id, {}):
+                self.postings[term].pop(recipe_id, None)
+
+            self.documents[recipe_id] = weights
+            for term, weight in weights.items():
+                self.postings[term][recipe_id] = weight
+
+    def ensure_built(self):
+        if self.postings is None:
+            documents = self.get_documents()
+            with self.lock:
+                self.postings = defaultdict(dict)
+                self.index(documents)
+
+    def update(self, recipe_ids):
+        if self.postings is None:
+            return
+
+        recipe_ids = set(recipe_ids)
+        documents = self.get_documents(recipe_ids)
+        documents.update({
+            recipe_id: {}
+            for recipe_id in recipe_ids if recipe_id not in documents
+        })
+        with self.lock:
+            self.index(documents)
+
+    def search(self, queryset, query):
+        self.ensure_built()
+        terms = set(get_terms(query))
+
+        with self.lock:
+            matches = [self.postings.get(term, {}) for term in terms]
+            recipe_ids = set.intersection(
+                *(set(match) for match in matches)) if matches else set()
+            ranked = sorted(
+                recipe_ids,
+                key=lambda recipe_id: (
+                    -sum(match[recipe_id] for match in matches), -recipe_id)
+            )
+
+        if not ranked:
+            return queryset.none()
+
+        return queryset.filter(pk__in=ranked).order_by(
+            Case(*(When(pk=recipe_id, then=position)
+                   for position, recipe_id in enumerate(ranked)))
+        )
+
+
+postgres_recipe_search = PostgresRecipeSearch()
+local_recipe_search = LocalRecipeSearch()
+
+
+def get_recipe_search():
+    if connection.vendor == 'postgresql':
+        return postgres_recipe_search
+    return local_recipe_search
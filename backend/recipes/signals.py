@@ -0,0 +1,155 @@
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .counters import change_counter, change_counters
+from .images import start_image_variants
+from .models import (FavoriteRecipe, Ingredient, Recipe,
+                     RecipeIngredientAmount, ShoppingCartRecipe,
+                     Subscription, User)
+from .search import get_recipe_search
+from .totals import apply_recipes, rebuild_recipe_totals, rebuild_totals
+
+# Sent with ``instance=recipe`` after its ingredient amounts were changed
+# by bulk queries, which send no model signals of their own.
+recipe_ingredients_changed = Signal()
+
+# Sent with ``instances`` and ``created`` once per batch of favourites,
+# cart recipes or subscriptions that bulk queries added or removed.
+# Single saves and deletes through the ORM are forwarded to it too.
+relations_changed = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, **kwargs):
+    get_recipe_search().update([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def queue_recipe_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(start_image_variants, instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search(sender, instance, **kwargs):
+    get_recipe_search().update([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredientAmount)
+@receiver(post_delete, sender=RecipeIngredientAmount)
+def update_recipe_ingredient_search(sender, instance, **kwargs):
+    get_recipe_search().update([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_ingredients_search(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        get_recipe_search().update([instance.pk])
+    elif pk_set:
+        get_recipe_search().update(pk_set)
+
+
+@receiver(recipe_ingredients_changed, sender=Recipe)
+def update_recipe_ingredients(sender, instance, **kwargs):
+    get_recipe_search().update([instance.pk])
+    rebuild_recipe_totals([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(sender, instance, created, **kwargs):
+    if not created:
+        get_recipe_search().update(
+            instance.recipe_ingredient_amounts.values_list(
+                'recipe_id', flat=True))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCartRecipe)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCartRecipe)
+@receiver(post_delete, sender=Subscription)
+def forward_relation_change(sender, instance, **kwargs):
+    deleted = kwargs['signal'] is post_delete
+    if deleted or kwargs['created']:
+        relations_changed.send(
+            sender=sender, instances=[instance], created=not deleted)
+
+
+@receiver(relations_changed, sender=ShoppingCartRecipe)
+def update_shopping_cart_totals(sender, instances, created, **kwargs):
+    recipe_ids = defaultdict(list)
+    for instance in instances:
+        recipe_ids[instance.user_id].append(instance.recipe_id)
+
+    for user_id, user_recipe_ids in recipe_ids.items():
+        apply_recipes(user_id, user_recipe_ids, 1 if created else -1)
+
+
+@receiver(post_save, sender=RecipeIngredientAmount)
+@receiver(post_delete, sender=RecipeIngredientAmount)
+def update_recipe_ingredient_totals(sender, instance, **kwargs):
+    rebuild_recipe_totals([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_ingredients_totals(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        rebuild_recipe_totals([instance.pk])
+    elif pk_set:
+        rebuild_recipe_totals(pk_set)
+    else:
+        rebuild_totals()
+
+
+def get_counter_delta(kwargs):
+    if kwargs['signal'] is post_delete:
+        return -1
+    return 1 if kwargs['created'] else 0
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_recipes_count(sender, instance, **kwargs):
+    delta = get_counter_delta(kwargs)
+    if delta:
+        change_counter(User, instance.author_id, 'recipes_count', delta)
+
+
+def get_counter_deltas(instances, field, created):
+    sign = 1 if created else -1
+    return {
+        pk: sign * count
+        for pk, count in Counter(
+            getattr(instance, field) for instance in instances).items()
+    }
+
+
+@receiver(relations_changed, sender=Subscription)
+def update_subscribers_count(sender, instances, created, **kwargs):
+    change_counters(User, 'subscribers_count',
+                    get_counter_deltas(instances, 'user_id', created))
+
+
+@receiver(relations_changed, sender=FavoriteRecipe)
+def update_favorites_count(sender, instances, created, **kwargs):
+    change_counters(Recipe, 'favorites_count',
+                    get_counter_deltas(instances, 'recipe_id', created))
+
+
+@receiver(relations_changed, sender=ShoppingCartRecipe)
+def update_carts_count(sender, instances, created, **kwargs):
+    change_counters(Recipe, 'carts_count',
+                    get_counter_deltas(instances, 'recipe_id', created))
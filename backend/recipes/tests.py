@@ -0,0 +1,107 @@
+from django.test import TestCase
+
+from .models import (FavoriteRecipe, Ingredient, Recipe,
+                     RecipeIngredientAmount, ShoppingCartRecipe, Subscription,
+                     User)
+from .relations import add_relation, set_recipe_ingredients
+from .totals import compute_totals, get_stored_totals
+
+
+class ShoppingCartTotalsTests(TestCase):
+    """Stored cart totals when a recipe is in several carts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{index}', email=f'user{index}@example.com',
+                password='password')
+            for index in range(2)
+        ]
+        cls.flour, cls.milk, cls.salt = (
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('мука', 'г'), ('молоко', 'мл'),
+                               ('соль', 'по вкусу'))
+        )
+        cls.shared = cls.create_recipe('Блины', {cls.flour: 3, cls.salt: 1})
+        cls.own = cls.create_recipe('Каша', {cls.milk: 100})
+
+        for user in cls.users:
+            ShoppingCartRecipe.objects.create(user=user, recipe=cls.shared)
+        ShoppingCartRecipe.objects.create(user=cls.users[0], recipe=cls.own)
+
+    @classmethod
+    def create_recipe(cls, name, amounts):
+        recipe = Recipe.objects.create(
+            author=cls.users[0], name=name, cooking_time=10)
+        for ingredient, amount in amounts.items():
+            RecipeIngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount)
+        return recipe
+
+    def assertTotals(self, expected):
+        self.assertEqual(get_stored_totals(), expected)
+        self.assertEqual(compute_totals(), expected)
+        self.assertEqual(compute_totals([self.users[0].id]), {
+            key: amount for key, amount in expected.items()
+            if key[0] == self.users[0].id
+        })
+
+    def test_amount_change_of_shared_recipe(self):
+        set_recipe_ingredients(self.shared, {self.flour.id: 4,
+                                             self.salt.id: 1})
+
+        first, second = (user.id for user in self.users)
+        self.assertTotals({
+            (first, self.flour.id): 4, (first, self.salt.id): 1,
+            (first, self.milk.id): 100,
+            (second, self.flour.id): 4, (second, self.salt.id): 1,
+        })
+
+    def test_ingredient_delete_of_shared_recipe(self):
+        RecipeIngredientAmount.objects.get(
+            recipe=self.shared, ingredient=self.salt).delete()
+
+        first, second = (user.id for user in self.users)
+        self.assertTotals({
+            (first, self.flour.id): 3, (first, self.milk.id): 100,
+            (second, self.flour.id): 3,
+        })
+
+
+class CounterFieldsTests(TestCase):
+    """Saving a loaded instance keeps counters changed meanwhile."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password')
+            for name in ('author', 'reader')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Блины', cooking_time=10)
+
+    def test_recipe_save_keeps_favorites_count(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        add_relation(FavoriteRecipe, 'recipe_id', recipe.pk,
+                     user_id=self.reader.pk)
+
+        recipe.name = 'Оладьи'
+        recipe.save()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Оладьи')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_user_save_keeps_subscribers_count(self):
+        author = User.objects.get(pk=self.author.pk)
+        Subscription.objects.create(user=author, subscriber=self.reader)
+
+        author.first_name = 'Иван'
+        author.save()
+
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Иван')
+        self.assertEqual(author.subscribers_count, 1)
@@ -0,0 +1,129 @@
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import (RecipeIngredientAmount, ShoppingCartRecipe,
+                     ShoppingCartTotal, User)
+
+
+def compute_totals(user_ids=None):
+    """Recompute ``{(user_id, ingredient_id): amount}`` from the carts."""
+    # Both conditions must go into one filter() call: separate calls on a
+    # multi-valued relation join the carts twice and multiply the amounts.
+    cart_filter = {'recipe__shopping_cart_recipes__isnull': False}
+    if user_ids is not None:
+        cart_filter['recipe__shopping_cart_recipes__user__in'] = user_ids
+    amounts = RecipeIngredientAmount.objects.filter(**cart_filter)
+
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in amounts.values_list(
+            'recipe__shopping_cart_recipes__user', 'ingredient'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by()
+    }
+
+
+def lock_users(user_ids):
+    """Serialise concurrent totals updates of the same users."""
+    # NO KEY UPDATE still serialises these updates, but unlike FOR UPDATE
+    # it does not block the foreign key checks of concurrent inserts
+    # referencing the users, which deadlocked with their counter updates.
+    list(User.objects.select_for_update(no_key=True).filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def add_totals(user_id, deltas):
+    """Add ``{ingredient_id: amount}`` to a user's totals in one upsert."""
+    meta = ShoppingCartTotal._meta
+    quote_name = connection.ops.quote_name
+    table = quote_name(meta.db_table)
+    user, ingredient, amount = (
+        quote_name(meta.get_field(name).column)
+        for name in ('user', 'ingredient', 'amount'))
+    sql = (
+        f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+        f'VALUES {", ".join(["(%s, %s, %s)"] * len(deltas))} '
+        f'ON CONFLICT ({user}, {ingredient}) '
+        f'DO UPDATE SET {amount} = {table}.{amount} + EXCLUDED.{amount}'
+    )
+    params = []
+    for ingredient_id, delta in deltas.items():
+        params += [user_id, ingredient_id, delta]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def subtract_totals(user_id, deltas):
+    """Subtract ``{ingredient_id: amount}`` from a user's totals."""
+    totals = ShoppingCartTotal.objects.filter(
+        user_id=user_id, ingredient_id__in=deltas)
+    delta = Case(
+        *(When(ingredient_id=ingredient_id, then=Value(delta))
+          for ingredient_id, delta in deltas.items()),
+        default=Value(0), output_field=IntegerField())
+    totals.update(amount=Greatest(F('amount') - delta, Value(0)))
+    totals.filter(amount=0).delete()
+
+
+def apply_recipes(user_id, recipe_ids, sign):
+    """Add (``sign=1``) or subtract (``sign=-1``) the amounts of recipes.
+
+    The amounts are summed per ingredient by the database, so a batch of
+    recipes costs the same few queries as a single one.
+    """
+    deltas = dict(
+        RecipeIngredientAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('ingredient_id').annotate(
+            total_amount=Sum('amount')
+        ).values_list('ingredient_id', 'total_amount')
+    )
+
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        lock_users([user_id])
+        if sign > 0:
+            add_totals(user_id, deltas)
+        else:
+            subtract_totals(user_id, deltas)
+
+
+def rebuild_totals(user_ids=None):
+    """Replace stored totals with a recompute, for some or all users."""
+    with transaction.atomic():
+        totals = ShoppingCartTotal.objects.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            lock_users(user_ids)
+            totals = totals.filter(user_id__in=user_ids)
+
+        totals.delete()
+        ShoppingCartTotal.objects.bulk_create(
+            ShoppingCartTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+            for (user_id, ingredient_id), amount
+            in compute_totals(user_ids).items()
+        )
+
+
+def rebuild_recipe_totals(recipe_ids):
+    """Rebuild totals of every user who has one of the recipes in cart."""
+    user_ids = set(ShoppingCartRecipe.objects.filter(
+        recipe_id__in=recipe_ids).values_list('user_id', flat=True))
+
+    if user_ids:
+        rebuild_totals(user_ids)
+
+
+def get_stored_totals():
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingCartTotal.objects.values_list(
+            'user_id', 'ingredient_id', 'amount')
+    }
@@ -53,6 +53,8 @@ class CustomUserAdmin(UserAdmin):
     form = CustomUserChangeForm
     add_form = CustomUserCreationForm
     list_filter = ('username', 'email')
+    list_display = ('username', 'email', 'first_name', 'last_name',
+                    'recipes_count', 'subscribers_count')
 
 
 admin.site.register(User, CustomUserAdmin)
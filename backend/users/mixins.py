@@ -0,0 +1,25 @@
+class CounterFieldsMixin:
+    """Keep ordinary saves from writing counter columns back.
+
+    Counters are changed by atomic ``UPDATE`` statements, so the copy a
+    loaded instance holds may be stale by the time it is saved. Saves of
+    existing rows without explicit ``update_fields`` write every other
+    loaded field instead.
+    """
+
+    counter_fields = ()
+
+    def get_saved_fields(self):
+        deferred_fields = self.get_deferred_fields()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key
+            if field.name not in self.counter_fields
+            if field.attname not in deferred_fields
+        ]
+
+    def save(self, *args, **kwargs):
+        is_update = not (self._state.adding or args)
+        if is_update and not kwargs.get('force_insert'):
+            kwargs.setdefault('update_fields', self.get_saved_fields())
+        super().save(*args, **kwargs)
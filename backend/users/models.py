@@ -3,9 +3,10 @@ from django.db import models
 
 from .constants import EMAIL_MAX_LENGTH, FIELD_MAX_LENGTH
 from .managers import CustomUserManager
+from .mixins import CounterFieldsMixin
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     email = models.EmailField(
         max_length=EMAIL_MAX_LENGTH,
         unique=True,
@@ -24,8 +25,18 @@ class User(AbstractUser):
         max_length=FIELD_MAX_LENGTH,
         verbose_name='Фамилия'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
     objects = CustomUserManager()
 
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']